@@ -1,146 +1,74 @@
 """
 Available AI models from OpenRouter
 """
+from functools import lru_cache
+
+_MODEL_FIELDS = ("id", "name", "provider", "description", "context")
 
 # Based on OpenRouter's current model offerings
-AVAILABLE_MODELS = [
+# (id, name, provider, description, context)
+_MODEL_ROWS = (
     # Claude Models (Anthropic)
-    {
-        "id": "anthropic/claude-opus-4.5",
-        "name": "Claude Opus 4.5",
-        "provider": "Anthropic",
-        "description": "Most capable Claude model for complex reasoning",
-        "context": "200K tokens"
-    },
-    {
-        "id": "anthropic/claude-3.7-sonnet",
-        "name": "Claude 3.7 Sonnet",
-        "provider": "Anthropic",
-        "description": "Balanced performance and speed",
-        "context": "200K tokens"
-    },
-    {
-        "id": "anthropic/claude-3.5-sonnet",
-        "name": "Claude 3.5 Sonnet",
-        "provider": "Anthropic",
-        "description": "Fast and efficient Claude model",
-        "context": "200K tokens"
-    },
-    
+    ("anthropic/claude-opus-4.5", "Claude Opus 4.5", "Anthropic", "Most capable Claude model for complex reasoning", "200K tokens"),
+    ("anthropic/claude-3.7-sonnet", "Claude 3.7 Sonnet", "Anthropic", "Balanced performance and speed", "200K tokens"),
+    ("anthropic/claude-3.5-sonnet", "Claude 3.5 Sonnet", "Anthropic", "Fast and efficient Claude model", "200K tokens"),
+
     # Gemini Models (Google)
-    {
-        "id": "google/gemini-3-pro",
-        "name": "Gemini 3 Pro",
-        "provider": "Google",
-        "description": "Flagship multimodal reasoning model",
-        "context": "1M tokens"
-    },
-    {
-        "id": "google/gemini-2.5-pro",
-        "name": "Gemini 2.5 Pro",
-        "provider": "Google",
-        "description": "Advanced reasoning and coding",
-        "context": "1M tokens"
-    },
-    {
-        "id": "google/gemini-2.5-flash",
-        "name": "Gemini 2.5 Flash",
-        "provider": "Google",
-        "description": "Fast and efficient Gemini model",
-        "context": "1M tokens"
-    },
-    {
-        "id": "google/gemini-flash-1.5",
-        "name": "Gemini Flash 1.5",
-        "provider": "Google",
-        "description": "Lightweight and fast",
-        "context": "1M tokens"
-    },
-    
+    ("google/gemini-3-pro", "Gemini 3 Pro", "Google", "Flagship multimodal reasoning model", "1M tokens"),
+    ("google/gemini-2.5-pro", "Gemini 2.5 Pro", "Google", "Advanced reasoning and coding", "1M tokens"),
+    ("google/gemini-2.5-flash", "Gemini 2.5 Flash", "Google", "Fast and efficient Gemini model", "1M tokens"),
+    ("google/gemini-flash-1.5", "Gemini Flash 1.5", "Google", "Lightweight and fast", "1M tokens"),
+
     # GPT Models (OpenAI)
-    {
-        "id": "openai/gpt-5.1",
-        "name": "GPT-5.1",
-        "provider": "OpenAI",
-        "description": "Latest frontier-grade reasoning model",
-        "context": "128K tokens"
-    },
-    {
-        "id": "openai/gpt-5.1-chat",
-        "name": "GPT-5.1 Chat (Instant)",
-        "provider": "OpenAI",
-        "description": "Fast, low-latency chat optimized",
-        "context": "128K tokens"
-    },
-    {
-        "id": "openai/gpt-5",
-        "name": "GPT-5",
-        "provider": "OpenAI",
-        "description": "Advanced reasoning and complex tasks",
-        "context": "128K tokens"
-    },
-    {
-        "id": "openai/gpt-4o",
-        "name": "GPT-4o",
-        "provider": "OpenAI",
-        "description": "Optimized GPT-4 model",
-        "context": "128K tokens"
-    },
-    {
-        "id": "openai/gpt-4-turbo",
-        "name": "GPT-4 Turbo",
-        "provider": "OpenAI",
-        "description": "Faster GPT-4 variant",
-        "context": "128K tokens"
-    },
-    
+    ("openai/gpt-5.1", "GPT-5.1", "OpenAI", "Latest frontier-grade reasoning model", "128K tokens"),
+    ("openai/gpt-5.1-chat", "GPT-5.1 Chat (Instant)", "OpenAI", "Fast, low-latency chat optimized", "128K tokens"),
+    ("openai/gpt-5", "GPT-5", "OpenAI", "Advanced reasoning and complex tasks", "128K tokens"),
+    ("openai/gpt-4o", "GPT-4o", "OpenAI", "Optimized GPT-4 model", "128K tokens"),
+    ("openai/gpt-4-turbo", "GPT-4 Turbo", "OpenAI", "Faster GPT-4 variant", "128K tokens"),
+
     # Grok Models (xAI)
-    {
-        "id": "x-ai/grok-4.1-fast",
-        "name": "Grok 4.1 Fast",
-        "provider": "xAI",
-        "description": "Best agentic tool-calling model",
-        "context": "2M tokens"
-    },
-    {
-        "id": "x-ai/grok-4",
-        "name": "Grok 4",
-        "provider": "xAI",
-        "description": "Latest reasoning model with vision",
-        "context": "256K tokens"
-    },
-    {
-        "id": "x-ai/grok-3",
-        "name": "Grok 3",
-        "provider": "xAI",
-        "description": "Flagship model for enterprise use",
-        "context": "256K tokens"
-    },
-    {
-        "id": "x-ai/grok-3-mini",
-        "name": "Grok 3 Mini",
-        "provider": "xAI",
-        "description": "Lightweight reasoning model",
-        "context": "128K tokens"
-    },
-]
+    ("x-ai/grok-4.1-fast", "Grok 4.1 Fast", "xAI", "Best agentic tool-calling model", "2M tokens"),
+    ("x-ai/grok-4", "Grok 4", "xAI", "Latest reasoning model with vision", "256K tokens"),
+    ("x-ai/grok-3", "Grok 3", "xAI", "Flagship model for enterprise use", "256K tokens"),
+    ("x-ai/grok-3-mini", "Grok 3 Mini", "xAI", "Lightweight reasoning model", "128K tokens"),
+)
+
+# Column views used by the lookup helpers
+_IDS = tuple(row[0] for row in _MODEL_ROWS)
+_PROVIDERS_COL = tuple(row[2] for row in _MODEL_ROWS)
+
+# Dict form for API responses, materialized once
+AVAILABLE_MODELS = [dict(zip(_MODEL_FIELDS, row)) for row in _MODEL_ROWS]
+
+
+# Lookup tables built once at import time
+_MODELS_BY_ID = {m["id"]: m for m in AVAILABLE_MODELS}
+_PROVIDERS = tuple(dict.fromkeys(_PROVIDERS_COL))
+
+
+@lru_cache(maxsize=16)
+def _models_for(provider: str) -> tuple:
+    """Build (once per provider) the tuple of that provider's models"""
+    return tuple(
+        _MODELS_BY_ID[model_id]
+        for model_id, model_provider in zip(_IDS, _PROVIDERS_COL)
+        if model_provider == provider
+    )
 
 
 def get_models_by_provider(provider: str = None):
     """Get models filtered by provider"""
     if provider:
-        return [m for m in AVAILABLE_MODELS if m["provider"] == provider]
+        # A fresh list per call, so callers can't alter the cached tuple
+        return list(_models_for(provider))
     return AVAILABLE_MODELS
 
 
 def get_model_by_id(model_id: str):
     """Get model details by ID"""
-    for model in AVAILABLE_MODELS:
-        if model["id"] == model_id:
-            return model
-    return None
+    return _MODELS_BY_ID.get(model_id)
 
 
 def get_providers():
     """Get list of unique providers"""
-    return list(set(m["provider"] for m in AVAILABLE_MODELS))
+    return list(_PROVIDERS)
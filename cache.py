@@ -0,0 +1,60 @@
+"""
+Short-lived in-memory cache for repeated read queries
+"""
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable
+
+DEFAULT_TTL = 5.0  # seconds
+
+_lock = threading.Lock()
+_entries = {}  # key -> (generation, expiry, value)
+_generation = 0
+
+
+def invalidate():
+    """Drop every cached result (call after any write that changes query results)"""
+    global _generation
+    with _lock:
+        _generation += 1
+        _entries.clear()
+
+
+def cached_call(fn: Callable, *args, ttl: float = DEFAULT_TTL, **kwargs) -> Any:
+    """
+    Call fn(*args, **kwargs), reusing a result computed within the last ttl seconds
+
+    Args:
+        fn: Function to call (must be hashable, e.g. a function or bound method)
+        ttl: Time to live for the cached result in seconds
+
+    Returns:
+        Cached or freshly computed result
+    """
+    key = (fn, args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+
+    with _lock:
+        generation = _generation
+        entry = _entries.get(key)
+        if entry and entry[0] == generation and entry[1] > now:
+            return entry[2]
+
+    value = fn(*args, **kwargs)
+
+    with _lock:
+        # Skip storing if the cache was invalidated while computing
+        if generation == _generation:
+            _entries[key] = (generation, now + ttl, value)
+    return value
+
+
+def ttl_cache(seconds: float = DEFAULT_TTL):
+    """Decorator version of cached_call"""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return cached_call(fn, *args, ttl=seconds, **kwargs)
+        return wrapper
+    return decorator
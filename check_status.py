@@ -5,16 +5,25 @@ Check current bot status and database
 import asyncio
 from whatsapp_bot import bot
 from database import db
+from cache import cached_call
 
 async def check_status():
     print("=" * 60)
     print("Checking Bot Status and Database")
     print("=" * 60)
     
+    # Run the independent queries concurrently, then print in order
+    stats, report = await asyncio.gather(
+        asyncio.to_thread(cached_call, bot.get_database_stats),
+        asyncio.to_thread(cached_call, db.get_latest_analysis_report),
+        return_exceptions=True
+    )
+    
     # Check database stats
     print("\n📊 Database Statistics:")
     try:
-        stats = bot.get_database_stats()
+        if isinstance(stats, Exception):
+            raise stats
         print(f"   Total messages in DB: {stats.get('total_messages', 0)}")
         print(f"   Total chats: {stats.get('total_chats', 0)}")
         print(f"   Date range: {stats.get('date_range', 'N/A')}")
@@ -24,7 +33,8 @@ async def check_status():
     # Check latest analysis report
     print("\n📋 Latest Analysis Report:")
     try:
-        report = db.get_latest_analysis_report()
+        if isinstance(report, Exception):
+            raise report
         if report:
             print(f"   ✅ Report found!")
             print(f"   Total conversations: {report.get('total_conversations', 0)}")
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import Optional
 from pydantic_settings import BaseSettings
 
@@ -31,6 +32,7 @@ class Settings(BaseSettings):
     message_analysis_minutes: int = 1440  # 24 hours default
     analyze_group_chats: bool = False
     analyze_all_conversations: bool = False
+    llm_min_conversations: int = 0  # Opt-in: fewer open conversations are reported without an AI call
     
     # Cron Schedule Configuration
     cron_enabled: bool = False
@@ -41,5 +43,16 @@ class Settings(BaseSettings):
         case_sensitive = False
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Get the shared Settings instance
+
+    Settings are validated and the env file is parsed only once; usable as
+    a FastAPI dependency via Depends(get_settings).
+    """
+    return Settings()
+
+
 # Global settings instance
-settings = Settings()
+settings = get_settings()
@@ -5,12 +5,32 @@ from fastapi import Request
 from typing import Optional, Dict, Any
 import logging
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
+# (request config key, settings attribute) pairs applied when the value is truthy
+_CONFIG_MAP = (
+    ('green_api_url', 'green_api_url'),
+    ('green_api_id', 'green_api_id_instance'),
+    ('green_api_token', 'green_api_token_instance'),
+    ('user_phone_number', 'user_phone_number'),
+    ('openrouter_key', 'openrouter_api_key'),
+    ('ai_model', 'openrouter_model'),
+)
+
+# Boolean flags applied whenever present, even when False
+_FLAG_KEYS = ('analyze_group_chats', 'analyze_all_conversations')
+
+_REQUIRED_FIELDS = frozenset({'green_api_id', 'green_api_token', 'openrouter_key'})
+
 
 class ConfigInjector:
     """Injects configuration from request body into settings"""
     
+    # Stateless: no per-instance __dict__ needed
+    __slots__ = ()
+    
     @staticmethod
     def extract_config(request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -29,40 +49,24 @@ class ConfigInjector:
         """
         Apply configuration to settings temporarily
         
+        The shared settings instance is mutated in place (never rebuilt), so
+        the cached object returned by config.get_settings() stays current.
+        
         Args:
             config: Configuration dictionary
         """
-        from config import settings
-        from green_api_client import GreenAPIClient
-        from openrouter_client import OpenRouterClient
-        
         if not config:
             return
         
         # Update settings temporarily (in-memory only)
-        if config.get('green_api_url'):
-            settings.green_api_url = config['green_api_url']
+        for source_key, settings_attr in _CONFIG_MAP:
+            value = config.get(source_key)
+            if value:
+                setattr(settings, settings_attr, value)
         
-        if config.get('green_api_id'):
-            settings.green_api_id_instance = config['green_api_id']
-        
-        if config.get('green_api_token'):
-            settings.green_api_token_instance = config['green_api_token']
-        
-        if config.get('user_phone_number'):
-            settings.user_phone_number = config['user_phone_number']
-        
-        if config.get('openrouter_key'):
-            settings.openrouter_api_key = config['openrouter_key']
-        
-        if config.get('ai_model'):
-            settings.openrouter_model = config['ai_model']
-            
-        if 'analyze_group_chats' in config:
-            settings.analyze_group_chats = config['analyze_group_chats']
-            
-        if 'analyze_all_conversations' in config:
-            settings.analyze_all_conversations = config['analyze_all_conversations']
+        for flag in _FLAG_KEYS:
+            if flag in config:
+                setattr(settings, flag, config[flag])
         
         logger.info("Configuration applied from request")
     
@@ -81,11 +85,11 @@ class ConfigInjector:
             return False, "No configuration provided"
         
         # Check required fields
-        required_fields = ['green_api_id', 'green_api_token', 'openrouter_key']
-        missing_fields = [field for field in required_fields if not config.get(field)]
+        present_fields = {key for key, value in config.items() if value}
+        missing_fields = _REQUIRED_FIELDS - present_fields
         
         if missing_fields:
-            return False, f"Missing required fields: {', '.join(missing_fields)}"
+            return False, f"Missing required fields: {', '.join(sorted(missing_fields))}"
         
         return True, ""
 
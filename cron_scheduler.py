@@ -4,6 +4,7 @@ Cron scheduler for automated WhatsApp bot analysis
 import logging
 import asyncio
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
@@ -12,29 +13,67 @@ from config import settings
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=32)
+def _build_trigger(cron_expr: str) -> CronTrigger:
+    """
+    Parse a cron expression into a CronTrigger (cached per expression)
+    
+    Args:
+        cron_expr: Cron expression (e.g., "0 9 * * *")
+        
+    Returns:
+        Configured CronTrigger
+    """
+    parts = cron_expr.split()
+    if len(parts) != 5:
+        raise ValueError("Invalid cron expression. Expected format: 'minute hour day month day_of_week'")
+    
+    minute, hour, day, month, day_of_week = parts
+    
+    return CronTrigger(
+        minute=minute,
+        hour=hour,
+        day=day,
+        month=month,
+        day_of_week=day_of_week
+    )
+
+
 class CronScheduler:
     """Manages scheduled analysis jobs"""
     
+    __slots__ = ("scheduler", "job", "is_running", "_status_cache", "_status_key", "_inflight")
+    
     def __init__(self):
         self.scheduler = AsyncIOScheduler()
         self.job = None
         self.is_running = False
+        self._status_cache: Optional[dict] = None
+        self._status_key: Optional[tuple] = None
+        self._inflight: Optional[asyncio.Task] = None
         
     async def run_scheduled_analysis(self):
-        """Run the analysis job"""
+        """Run the analysis job (skipped if a previous run is still in progress)"""
+        if self._inflight and not self._inflight.done():
+            logger.warning("Analysis already running, skipping scheduled run")
+            return
+        
         try:
             logger.info("Running scheduled analysis...")
             from whatsapp_bot import bot
             
-            result = await bot.analyze_and_report(
+            self._inflight = asyncio.create_task(bot.analyze_and_report(
                 target_chat_id=None,
                 minutes=settings.message_analysis_minutes
-            )
+            ))
+            result = await self._inflight
             
-            logger.info(f"Scheduled analysis completed: {result}")
+            logger.info("Scheduled analysis completed: %s", result)
             
         except Exception as e:
-            logger.error(f"Scheduled analysis failed: {e}")
+            logger.error("Scheduled analysis failed: %s", e)
+        finally:
+            self._inflight = None
     
     def start(self, cron_expression: str = None):
         """
@@ -53,21 +92,8 @@ class CronScheduler:
         self.scheduler = AsyncIOScheduler()
         
         try:
-            # Parse cron expression
-            parts = cron_expr.split()
-            if len(parts) != 5:
-                raise ValueError("Invalid cron expression. Expected format: 'minute hour day month day_of_week'")
-            
-            minute, hour, day, month, day_of_week = parts
-            
-            # Create cron trigger
-            trigger = CronTrigger(
-                minute=minute,
-                hour=hour,
-                day=day,
-                month=month,
-                day_of_week=day_of_week
-            )
+            # Parse cron expression (triggers are immutable, so cached ones are reused)
+            trigger = _build_trigger(cron_expr)
             
             # Add job
             self.job = self.scheduler.add_job(
@@ -81,12 +107,13 @@ class CronScheduler:
             # Start scheduler
             self.scheduler.start()
             self.is_running = True
+            self._status_key = None
             
-            logger.info(f"Cron scheduler started with expression: {cron_expr}")
-            logger.info(f"Next run time: {self.job.next_run_time}")
+            logger.info("Cron scheduler started with expression: %s", cron_expr)
+            logger.info("Next run time: %s", self.job.next_run_time)
             
         except Exception as e:
-            logger.error(f"Failed to start scheduler: {e}")
+            logger.error("Failed to start scheduler: %s", e)
             raise
     
     def stop(self):
@@ -98,24 +125,35 @@ class CronScheduler:
         try:
             self.scheduler.shutdown(wait=False)
             self.is_running = False
+            self._status_key = None
             logger.info("Cron scheduler stopped")
         except Exception as e:
-            logger.error(f"Failed to stop scheduler: {e}")
+            logger.error("Failed to stop scheduler: %s", e)
     
     def get_status(self) -> dict:
-        """Get scheduler status"""
+        """Get scheduler status (cached until running state, schedule or next run changes)"""
+        next_run_time = getattr(self.job, 'next_run_time', None) if self.is_running else None
+        key = (self.is_running, settings.cron_schedule, next_run_time)
+        if key == self._status_key:
+            # Callers get a copy, so mutating a response can't corrupt the cache
+            return dict(self._status_cache)
+        
         if not self.is_running:
-            return {
+            status = {
                 "enabled": False,
                 "schedule": settings.cron_schedule,
                 "next_run": None
             }
+        else:
+            status = {
+                "enabled": True,
+                "schedule": settings.cron_schedule,
+                "next_run": next_run_time.isoformat() if next_run_time else None
+            }
         
-        return {
-            "enabled": True,
-            "schedule": settings.cron_schedule,
-            "next_run": self.job.next_run_time.isoformat() if self.job and self.job.next_run_time else None
-        }
+        self._status_key = key
+        self._status_cache = status
+        return dict(status)
     
     def update_schedule(self, cron_expression: str):
         """
@@ -131,6 +169,7 @@ class CronScheduler:
         
         # Update settings
         settings.cron_schedule = cron_expression
+        self._status_key = None
         
         if was_running:
             self.start(cron_expression)
@@ -1,19 +1,103 @@
 import sqlite3
 import logging
 import json
+import atexit
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from contextlib import contextmanager
 from models import GreenAPIMessage, PriorityReport, DashboardStats
 from config import settings
+import cache
+
+
+# Every messages column in table order, so the read APIs return the same dicts SELECT * did
+_MESSAGE_COLUMNS = (
+    'id', 'message_id', 'type', 'timestamp', 'type_message', 'chat_id',
+    'sender_id', 'sender_name', 'sender_contact_name', 'text_message',
+    'is_forwarded', 'forwarding_score', 'download_url', 'caption',
+    'file_name', 'is_edited', 'is_deleted', 'created_at'
+)
+_MESSAGE_SELECT = f"SELECT {', '.join(_MESSAGE_COLUMNS)} FROM messages"
+
+# Hot read queries, kept as constants so sqlite3's statement cache reuses them
+_SQL_DAILY_STATS_BY_DATE = 'SELECT * FROM daily_stats WHERE date = ?'
+_SQL_RECENT_MESSAGES = f'{_MESSAGE_SELECT} ORDER BY timestamp DESC LIMIT ?'
+_SQL_RECENT_MESSAGES_BY_CHAT = f'{_MESSAGE_SELECT} WHERE chat_id = ? ORDER BY timestamp DESC LIMIT ?'
+_SQL_RECENT_PRIVATE_MESSAGES = f"{_MESSAGE_SELECT} WHERE chat_id NOT LIKE '%@g.us' ORDER BY timestamp DESC LIMIT ?"
+# Newest N per chat via a window over idx_messages_chat_ts, returned oldest first per chat
+_SQL_LAST_MESSAGES_PER_CHAT = f'''
+    SELECT {', '.join(_MESSAGE_COLUMNS)} FROM (
+        SELECT {', '.join(_MESSAGE_COLUMNS)},
+               ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY timestamp DESC) AS rn
+        FROM messages WHERE chat_id IN ({{placeholders}})
+    ) WHERE rn <= ? ORDER BY chat_id, rn DESC
+'''
+_SQL_LATEST_REPORT_DATA = 'SELECT report_data FROM analysis_reports ORDER BY report_date DESC LIMIT 1'
+
+# Write statements, same reasoning: one string object per statement for the cache key
+_SQL_INSERT_MESSAGE = (
+    'INSERT OR IGNORE INTO messages ('
+    'message_id, type, timestamp, type_message, chat_id, '
+    'sender_id, sender_name, sender_contact_name, text_message, '
+    'is_forwarded, forwarding_score, download_url, caption, '
+    'file_name, is_edited, is_deleted'
+    ') VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+_SQL_UPSERT_CONVERSATION = (
+    'INSERT OR REPLACE INTO conversations ('
+    'chat_id, chat_name, last_message_time, message_count, '
+    'is_unanswered, last_analyzed, updated_at'
+    ') VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'
+)
+_SQL_INSERT_REPORT = (
+    'INSERT INTO analysis_reports ('
+    'report_date, total_conversations, urgent_conversations, '
+    'important_conversations, normal_conversations, summary, report_data'
+    ') VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+_SQL_UPSERT_DAILY_STATS = (
+    'INSERT OR REPLACE INTO daily_stats ('
+    'date, total_messages, unanswered_conversations, '
+    'urgent_conversations, active_chats, analyses_run, updated_at'
+    ') VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'
+)
+
+
+
+def _message_dict(row: tuple, _columns: tuple = _MESSAGE_COLUMNS) -> Dict[str, Any]:
+    """Build a message dict from a plain row tuple"""
+    return dict(zip(_columns, row))
+
+
+# Rows deleted per transaction by cleanup_old_data
+_CLEANUP_CHUNK_SIZE = 10000
+
+# Per-connection tuning (WAL journal mode is persistent and set once per database file)
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
 
 
 class DatabaseManager:
     """SQLite database manager for storing message history and analytics"""
     
+    _wal_enabled = False
+    
     def __init__(self):
         self.db_path = settings.database_url.replace("sqlite:///", "")
         self.logger = logging.getLogger(__name__)
+        
+        # One persistent connection per thread, closed at interpreter exit
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        atexit.register(self.close)
+        
         self._init_database()
     
     def _init_database(self):
@@ -51,7 +135,7 @@ class DatabaseManager:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     chat_id TEXT UNIQUE NOT NULL,
                     chat_name TEXT,
-                    last_message_time TIMESTAMP NOT NULL,
+                    last_message_time INTEGER NOT NULL,  -- unix seconds
                     message_count INTEGER DEFAULT 0,
                     is_unanswered BOOLEAN DEFAULT FALSE,
                     last_analyzed TIMESTAMP,
@@ -64,7 +148,7 @@ class DatabaseManager:
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS analysis_reports (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    report_date TIMESTAMP NOT NULL,
+                    report_date INTEGER NOT NULL,  -- unix seconds
                     total_conversations INTEGER NOT NULL,
                     urgent_conversations INTEGER NOT NULL,
                     important_conversations INTEGER NOT NULL,
@@ -90,28 +174,158 @@ class DatabaseManager:
                 )
             ''')
             
+            # Migrate text timestamps from older databases to unix seconds so
+            # comparisons and index lookups run on integers
+            cursor.execute('''
+                UPDATE conversations
+                SET last_message_time = CAST(strftime('%s', last_message_time, 'utc') AS INTEGER)
+                WHERE typeof(last_message_time) = 'text'
+            ''')
+            cursor.execute('''
+                UPDATE analysis_reports
+                SET report_date = CAST(strftime('%s', report_date, 'utc') AS INTEGER)
+                WHERE typeof(report_date) = 'text'
+            ''')
+            
             # Create indexes for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id)')
+            # (chat_id, timestamp DESC) serves per-chat "latest N" queries without a sort
+            has_chat_ts_index = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_messages_chat_ts'"
+            ).fetchone()
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_ts ON messages(chat_id, timestamp DESC)')
+            cursor.execute('DROP INDEX IF EXISTS idx_messages_chat_id')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_chat_id ON conversations(chat_id)')
+            # Covers get_conversation_history: range on last_message_time, aggregates read from the index
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_time_covering
+                ON conversations(last_message_time, is_unanswered, message_count)
+            ''')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_reports_date ON analysis_reports(report_date)')
             
             conn.commit()
+            
+            if not has_chat_ts_index:
+                # Refresh planner statistics so the new index is picked up
+                conn.execute('ANALYZE')
+            
             self.logger.info("Database initialized successfully")
     
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new connection for the current thread"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row  # Enable dictionary-like access
+        self._configure_connection(conn)
+        
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
     @contextmanager
     def get_connection(self):
-        """Get database connection with proper error handling"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable dictionary-like access
+        """Get this thread's persistent database connection with proper error handling"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        
         try:
             yield conn
         except Exception as e:
             conn.rollback()
             self.logger.error(f"Database error: {e}")
             raise
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Group several write methods into one transaction (and one commit) on this thread
+        
+        Writes inside the block skip their own commit; everything is committed when the
+        block exits, or rolled back if it raises. Nested blocks join the outer one.
+        """
+        if getattr(self._local, 'in_transaction', False):
+            yield
+            return
+        
+        self._local.in_transaction = True
+        try:
+            with self.get_connection() as conn:
+                yield
+                conn.commit()
         finally:
-            conn.close()
+            self._local.in_transaction = False
+            cache.invalidate()
+    
+    def _commit(self, conn: sqlite3.Connection, changed: bool = True):
+        """Commit a write and drop cached query results, unless inside transaction()"""
+        if getattr(self._local, 'in_transaction', False):
+            return
+        conn.commit()
+        if changed:
+            cache.invalidate()
+    
+    def close(self):
+        """Close all open connections"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+    
+    def _fetch_messages(self, conn: sqlite3.Connection, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        """Run a message SELECT returning plain tuples (no sqlite3.Row) and convert them to dicts"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(sql, params).fetchall()
+        return list(map(_message_dict, rows))
+    
+    def _execute_batch(self, conn: sqlite3.Connection, sql: str, rows: List[tuple], what: str) -> int:
+        """
+        Run one write statement for many rows, skipping rows that fail
+        
+        The batch goes through a single executemany. If any row raises, the batch is
+        rolled back to a savepoint and replayed row by row, so only the bad rows are
+        logged and skipped (as the old per-row loops did).
+        
+        Args:
+            conn: Connection to write on
+            sql: Statement to run per row
+            rows: Parameter tuples; the first item identifies the row in error logs
+            what: Row description for log messages (e.g. "message")
+        
+        Returns:
+            Number of rows changed
+        """
+        if not conn.in_transaction:
+            # Keep the savepoint nested so RELEASE doesn't commit on its own
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT batch")
+        try:
+            changes_before = conn.total_changes
+            try:
+                conn.executemany(sql, rows)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Batch write of {len(rows)} {what} rows failed ({e}), retrying row by row")
+                conn.execute("ROLLBACK TO batch")
+                changes_before = conn.total_changes
+                for row in rows:
+                    try:
+                        conn.execute(sql, row)
+                    except sqlite3.Error as e:
+                        self.logger.error(f"Error storing {what} {row[0]}: {e}")
+            return conn.total_changes - changes_before
+        finally:
+            conn.execute("RELEASE batch")
+    
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """Apply performance PRAGMAs to a new connection"""
+        if not DatabaseManager._wal_enabled:
+            # WAL + synchronous=NORMAL avoids an fsync per commit while keeping committed data safe
+            conn.execute("PRAGMA journal_mode=WAL")
+            DatabaseManager._wal_enabled = True
+        
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
     
     def store_messages(self, messages: List[GreenAPIMessage]) -> int:
         """
@@ -126,37 +340,26 @@ class DatabaseManager:
         if not messages:
             return 0
         
+        rows = [
+            (
+                message.id_message, message.type, message.timestamp,
+                message.type_message, message.chat_id, message.sender_id,
+                message.sender_name, message.sender_contact_name,
+                message.text_message, message.is_forwarded,
+                message.forwarding_score, message.download_url,
+                message.caption, message.file_name, message.is_edited,
+                message.is_deleted
+            )
+            for message in messages
+        ]
+        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            new_messages_count = 0
-            
-            for message in messages:
-                try:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO messages (
-                            message_id, type, timestamp, type_message, chat_id,
-                            sender_id, sender_name, sender_contact_name, text_message,
-                            is_forwarded, forwarding_score, download_url, caption,
-                            file_name, is_edited, is_deleted
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        message.id_message, message.type, message.timestamp,
-                        message.type_message, message.chat_id, message.sender_id,
-                        message.sender_name, message.sender_contact_name,
-                        message.text_message, message.is_forwarded,
-                        message.forwarding_score, message.download_url,
-                        message.caption, message.file_name, message.is_edited,
-                        message.is_deleted
-                    ))
-                    
-                    if cursor.rowcount > 0:
-                        new_messages_count += 1
-                
-                except sqlite3.Error as e:
-                    self.logger.error(f"Error storing message {message.id_message}: {e}")
-                    continue
+            # INSERT OR IGNORE only counts rows that were actually inserted. This is
+            # preferred over INSERT ... RETURNING, which executemany() cannot return
+            # rows from and would force one execute() per message
+            new_messages_count = self._execute_batch(conn, _SQL_INSERT_MESSAGE, rows, "message")
             
-            conn.commit()
+            self._commit(conn, changed=bool(new_messages_count))
             self.logger.info(f"Stored {new_messages_count} new messages")
             return new_messages_count
     
@@ -173,20 +376,31 @@ class DatabaseManager:
             message_count: Number of messages in conversation
             is_unanswered: Whether conversation is unanswered
         """
+        self.bulk_update_conversations([
+            (chat_id, chat_name, last_message_time, message_count, is_unanswered)
+        ])
+    
+    def bulk_update_conversations(self, records: List[tuple]):
+        """
+        Update or insert many conversations in a single transaction
+        
+        Args:
+            records: (chat_id, chat_name, last_message_time, message_count, is_unanswered) tuples
+        """
+        if not records:
+            return
+        
+        last_analyzed = datetime.now()
+        rows = [
+            (chat_id, chat_name, int(last_message_time.timestamp()),
+             message_count, is_unanswered, last_analyzed)
+            for chat_id, chat_name, last_message_time, message_count, is_unanswered in records
+        ]
+        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO conversations (
-                    chat_id, chat_name, last_message_time, message_count,
-                    is_unanswered, last_analyzed, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (
-                chat_id, chat_name, last_message_time, message_count,
-                is_unanswered, datetime.now()
-            ))
+            self._execute_batch(conn, _SQL_UPSERT_CONVERSATION, rows, "conversation")
             
-            conn.commit()
+            self._commit(conn)
     
     def store_analysis_report(self, report: PriorityReport):
         """
@@ -195,28 +409,18 @@ class DatabaseManager:
         Args:
             report: PriorityReport to store
         """
-        import json
-        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO analysis_reports (
-                    report_date, total_conversations, urgent_conversations,
-                    important_conversations, normal_conversations,
-                    summary, report_data
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                datetime.now(),
+            conn.execute(_SQL_INSERT_REPORT, (
+                int(time.time()),
                 report.total_conversations,
                 len(report.urgent_conversations),
                 len(report.important_conversations),
                 len(report.normal_conversations),
                 report.summary,
-                json.dumps(report.dict(), ensure_ascii=False)
+                report.model_dump_json()
             ))
             
-            conn.commit()
+            self._commit(conn)
             self.logger.info("Analysis report stored successfully")
     
     def get_daily_stats(self, date: datetime = None) -> Dict[str, Any]:
@@ -233,13 +437,7 @@ class DatabaseManager:
             date = datetime.now().date()
         
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM daily_stats WHERE date = ?
-            ''', (date,))
-            
-            row = cursor.fetchone()
+            row = conn.execute(_SQL_DAILY_STATS_BY_DATE, (date,)).fetchone()
             
             if row:
                 return dict(row)
@@ -262,15 +460,8 @@ class DatabaseManager:
             stats: Statistics to update
         """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO daily_stats (
-                    date, total_messages, unanswered_conversations,
-                    urgent_conversations, active_chats, analyses_run, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (
-                stats.get('date', datetime.now().date()),
+            conn.execute(_SQL_UPSERT_DAILY_STATS, (
+                stats.get('date') or datetime.now().date(),
                 stats.get('total_messages', 0),
                 stats.get('unanswered_conversations', 0),
                 stats.get('urgent_conversations', 0),
@@ -278,38 +469,27 @@ class DatabaseManager:
                 stats.get('analyses_run', 0)
             ))
             
-            conn.commit()
+            self._commit(conn)
     
-    def get_recent_messages(self, limit: int = 100, chat_id: str = None) -> List[Dict[str, Any]]:
+    def get_recent_messages(self, limit: int = 100, chat_id: str = None,
+                            exclude_groups: bool = False) -> List[Dict[str, Any]]:
         """
         Get recent messages from database
         
         Args:
             limit: Maximum number of messages to return
             chat_id: Filter by specific chat ID (optional)
+            exclude_groups: Skip group chat messages (ignored when chat_id is given)
         
         Returns:
             List of message dictionaries
         """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
             if chat_id:
-                cursor.execute('''
-                    SELECT * FROM messages 
-                    WHERE chat_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (chat_id, limit))
-            else:
-                cursor.execute('''
-                    SELECT * FROM messages 
-                    ORDER BY timestamp DESC 
-                    LIMIT ?
-                ''', (limit,))
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+                return self._fetch_messages(conn, _SQL_RECENT_MESSAGES_BY_CHAT, (chat_id, limit))
+            if exclude_groups:
+                return self._fetch_messages(conn, _SQL_RECENT_PRIVATE_MESSAGES, (limit,))
+            return self._fetch_messages(conn, _SQL_RECENT_MESSAGES, (limit,))
     
     def get_conversation_history(self, days: int = 7) -> List[Dict[str, Any]]:
         """
@@ -324,19 +504,19 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            since_date = datetime.now() - timedelta(days=days)
+            since_ts = int(time.time()) - days * 86400
             
             cursor.execute('''
                 SELECT 
-                    DATE(last_message_time) as date,
+                    DATE(last_message_time, 'unixepoch', 'localtime') as date,
                     COUNT(*) as conversations,
                     SUM(CASE WHEN is_unanswered = 1 THEN 1 ELSE 0 END) as unanswered,
                     AVG(message_count) as avg_messages_per_chat
                 FROM conversations 
                 WHERE last_message_time >= ?
-                GROUP BY DATE(last_message_time)
+                GROUP BY date
                 ORDER BY date DESC
-            ''', (since_date,))
+            ''', (since_ts,))
             
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
@@ -356,14 +536,15 @@ class DatabaseManager:
             
             cursor.execute('''
                 SELECT 
-                    id, report_date, total_conversations, 
-                    urgent_conversations, important_conversations,
+                    id, DATETIME(report_date, 'unixepoch', 'localtime') as report_date,
+                    total_conversations, urgent_conversations, important_conversations,
                     normal_conversations, summary
                 FROM analysis_reports 
-                ORDER BY report_date DESC 
+                ORDER BY analysis_reports.report_date DESC 
                 LIMIT ?
             ''', (limit,))
             
+            # report_date comes back as the local "YYYY-MM-DD HH:MM:SS" text it was stored as before
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
     
@@ -375,19 +556,31 @@ class DatabaseManager:
             days_to_keep: Number of days to keep data
         """
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+        cutoff_ts = int(cutoff_date.timestamp())
         
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Clean up old messages
-            cursor.execute('DELETE FROM messages WHERE timestamp < ?', (cutoff_date.timestamp(),))
-            messages_deleted = cursor.rowcount
+            # Clean up old messages in chunks so writers aren't blocked by one huge transaction
+            messages_deleted = 0
+            while True:
+                cursor = conn.execute('''
+                    DELETE FROM messages WHERE rowid IN (
+                        SELECT rowid FROM messages WHERE timestamp < ? LIMIT ?
+                    )
+                ''', (cutoff_ts, _CLEANUP_CHUNK_SIZE))
+                conn.commit()
+                messages_deleted += cursor.rowcount
+                if cursor.rowcount < _CLEANUP_CHUNK_SIZE:
+                    break
             
             # Clean up old analysis reports
-            cursor.execute('DELETE FROM analysis_reports WHERE report_date < ?', (cutoff_date,))
+            cursor = conn.execute('DELETE FROM analysis_reports WHERE report_date < ?', (cutoff_ts,))
             reports_deleted = cursor.rowcount
             
             conn.commit()
+            cache.invalidate()
+            
+            # Fold the deletes back into the main database file and shrink the WAL
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
             
             self.logger.info(f"Cleaned up {messages_deleted} old messages and {reports_deleted} old reports")
     
@@ -399,15 +592,7 @@ class DatabaseManager:
             Dictionary with report data or None if no reports exist
         """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT report_data FROM analysis_reports
-                ORDER BY report_date DESC
-                LIMIT 1
-            ''')
-            
-            row = cursor.fetchone()
+            row = conn.execute(_SQL_LATEST_REPORT_DATA).fetchone()
             
             if row:
                 return json.loads(row['report_data'])
@@ -425,22 +610,37 @@ class DatabaseManager:
             List of message dictionaries
         """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM messages
-                WHERE chat_id = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (chat_id, limit))
+            messages = self._fetch_messages(conn, _SQL_RECENT_MESSAGES_BY_CHAT, (chat_id, limit))
             
-            rows = cursor.fetchall()
-            
-            # Convert to list of dicts and reverse to get chronological order
-            messages = [dict(row) for row in rows]
+            # Reverse to get chronological order
             messages.reverse()
             
             return messages
+    
+    def get_last_messages_per_chat(self, chat_ids: List[str], per_chat_limit: int = 4) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the last N messages for several chats in a single query
+        
+        Args:
+            chat_ids: Chat IDs to get messages for
+            per_chat_limit: Number of messages to retrieve per chat (default: 4)
+        
+        Returns:
+            Dictionary mapping each chat ID to its messages in chronological order
+        """
+        unique_ids = list(dict.fromkeys(chat_ids))
+        grouped = {chat_id: [] for chat_id in unique_ids}
+        if not unique_ids:
+            return grouped
+        
+        placeholders = ', '.join('?' * len(unique_ids))
+        sql = _SQL_LAST_MESSAGES_PER_CHAT.format(placeholders=placeholders)
+        
+        with self.get_connection() as conn:
+            for message in self._fetch_messages(conn, sql, (*unique_ids, per_chat_limit)):
+                grouped[message['chat_id']].append(message)
+        
+        return grouped
 
 
 # Global database instance
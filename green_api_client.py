@@ -1,34 +1,130 @@
+import orjson
 import requests
 import logging
+import threading
+import time
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from config import settings
+from pydantic import TypeAdapter
 from models import GreenAPIMessage
 
 
+# Validates a whole payload in a single pydantic-core call instead of one call per message
+_MESSAGE_LIST_ADAPTER = TypeAdapter(List[GreenAPIMessage])
+
+# Green API methods this client calls; their full URLs are built once per client
+_ENDPOINTS = (
+    "lastIncomingMessages", "lastOutgoingMessages", "sendMessage",
+    "getStateInstance", "getWaSettings", "getChatHistory",
+)
+
+# Request bodies are serialized with orjson and sent as raw bytes
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
 class GreenAPIClient:
     """Client for interacting with Green API"""
     
+    # Green API sends no ETag/Last-Modified to revalidate against, so repeated account
+    # info reads within this window (seconds) are served from a local cache. Messages are
+    # always fetched fresh: the manual refresh and every analysis need the current state.
+    ACCOUNT_INFO_TTL = 300
+    
     def __init__(self):
         self.base_url = settings.green_api_url
         self.id_instance = settings.green_api_id_instance
         self.token_instance = settings.green_api_token_instance
         self.logger = logging.getLogger(__name__)
+        
+        # URL pieces shared by every endpoint: {base}/waInstance{id}/{method}/{token}
+        self._url_prefix = f"{self.base_url}/waInstance{self.id_instance}"
+        self._token_suffix = f"/{self.token_instance}"
+        self._urls = {method: f"{self._url_prefix}/{method}{self._token_suffix}" for method in _ENDPOINTS}
+        
+        # Shared session keeps TCP/TLS connections to Green API alive between calls
+        self.session = requests.Session()
+        # Transient errors are retried with backoff; POST (sendMessage) is not retried
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retries)
+        # Self-hosted Green API gateways may be configured with a plain http:// URL
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # (endpoint, params) -> (expiry, value)
+        self._response_cache: Dict[tuple, tuple] = {}
+        self._response_cache_lock = threading.Lock()
+    
+    def _get_cached(self, key: tuple) -> Any:
+        """Return a cached response value for key, or None if missing or expired"""
+        with self._response_cache_lock:
+            entry = self._response_cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+    
+    def _set_cached(self, key: tuple, value: Any, ttl: float):
+        """Cache a response value for ttl seconds"""
+        with self._response_cache_lock:
+            self._response_cache[key] = (time.monotonic() + ttl, value)
+    
+    @staticmethod
+    def _decode_json(response: requests.Response) -> Any:
+        """Decode a JSON response body with orjson straight from the raw bytes"""
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as e:
+            # Keep the same exception type response.json() raises
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+    
+    @staticmethod
+    def _parse_messages(messages_data: List[Dict[str, Any]]) -> List[GreenAPIMessage]:
+        """Convert raw Green API message dicts (camelCase keys) into GreenAPIMessage objects"""
+        return _MESSAGE_LIST_ADAPTER.validate_python(messages_data)
+    
+    def _url(self, method: str) -> str:
+        """Return the full URL for a Green API method (prebuilt for the known endpoints)"""
+        url = self._urls.get(method)
+        if url is None:
+            url = f"{self._url_prefix}/{method}{self._token_suffix}"
+        return url
+    
+    def _post_json(self, url: str, payload: Dict[str, Any]) -> requests.Response:
+        """POST a JSON body serialized with orjson"""
+        return self.session.post(url, data=orjson.dumps(payload), headers=_JSON_HEADERS)
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        self.session.close()
+    
+    def __enter__(self) -> "GreenAPIClient":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def _make_request(self, endpoint: str, method: str = "GET", data: Optional[Dict] = None) -> Dict[str, Any]:
         """Make HTTP request to Green API"""
-        url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}/{self.token_instance}"
+        url = self._url(endpoint)
         
         try:
             if method == "GET":
-                response = requests.get(url)
+                response = self.session.get(url)
             elif method == "POST":
-                response = requests.post(url, json=data)
+                response = self._post_json(url, data)
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
             
             response.raise_for_status()
-            return response.json()
+            return self._decode_json(response)
         
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Green API request failed: {e}")
@@ -45,37 +141,14 @@ class GreenAPIClient:
             List of GreenAPIMessage objects
         """
         try:
-            endpoint = f"lastIncomingMessages/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}?minutes={minutes}"
+            url = self._url("lastIncomingMessages")
             
             self.logger.info(f"Fetching messages from Green API for the last {minutes} minutes")
-            response = requests.get(url)
+            response = self.session.get(url, params={"minutes": minutes})
             response.raise_for_status()
             
-            messages_data = response.json()
-            messages = []
-            
-            for msg_data in messages_data:
-                # Convert snake_case to camelCase for our model
-                message = GreenAPIMessage(
-                    type=msg_data.get('type', ''),
-                    id_message=msg_data.get('idMessage', ''),
-                    timestamp=msg_data.get('timestamp', 0),
-                    type_message=msg_data.get('typeMessage', ''),
-                    chat_id=msg_data.get('chatId', ''),
-                    sender_id=msg_data.get('senderId'),
-                    sender_name=msg_data.get('senderName'),
-                    sender_contact_name=msg_data.get('senderContactName'),
-                    text_message=msg_data.get('textMessage'),
-                    is_forwarded=msg_data.get('isForwarded', False),
-                    forwarding_score=msg_data.get('forwardingScore', 0),
-                    download_url=msg_data.get('downloadUrl'),
-                    caption=msg_data.get('caption'),
-                    file_name=msg_data.get('fileName'),
-                    is_edited=msg_data.get('isEdited', False),
-                    is_deleted=msg_data.get('isDeleted', False)
-                )
-                messages.append(message)
+            messages_data = self._decode_json(response)
+            messages = self._parse_messages(messages_data)
             
             self.logger.info(f"Successfully fetched {len(messages)} messages")
             return messages
@@ -95,37 +168,14 @@ class GreenAPIClient:
             List of GreenAPIMessage objects
         """
         try:
-            endpoint = f"lastOutgoingMessages/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}?minutes={minutes}"
+            url = self._url("lastOutgoingMessages")
             
             self.logger.info(f"Fetching outgoing messages from Green API for the last {minutes} minutes")
-            response = requests.get(url)
+            response = self.session.get(url, params={"minutes": minutes})
             response.raise_for_status()
             
-            messages_data = response.json()
-            messages = []
-            
-            for msg_data in messages_data:
-                # Convert snake_case to camelCase for our model
-                message = GreenAPIMessage(
-                    type=msg_data.get('type', ''),
-                    id_message=msg_data.get('idMessage', ''),
-                    timestamp=msg_data.get('timestamp', 0),
-                    type_message=msg_data.get('typeMessage', ''),
-                    chat_id=msg_data.get('chatId', ''),
-                    sender_id=msg_data.get('senderId'),
-                    sender_name=msg_data.get('senderName'),
-                    sender_contact_name=msg_data.get('senderContactName'),
-                    text_message=msg_data.get('textMessage'),
-                    is_forwarded=msg_data.get('isForwarded', False),
-                    forwarding_score=msg_data.get('forwardingScore', 0),
-                    download_url=msg_data.get('downloadUrl'),
-                    caption=msg_data.get('caption'),
-                    file_name=msg_data.get('fileName'),
-                    is_edited=msg_data.get('isEdited', False),
-                    is_deleted=msg_data.get('isDeleted', False)
-                )
-                messages.append(message)
+            messages_data = self._decode_json(response)
+            messages = self._parse_messages(messages_data)
             
             self.logger.info(f"Successfully fetched {len(messages)} outgoing messages")
             return messages
@@ -146,8 +196,7 @@ class GreenAPIClient:
             Response from Green API
         """
         try:
-            endpoint = f"sendMessage/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}"
+            url = self._url("sendMessage")
             
             data = {
                 "chatId": chat_id,
@@ -155,10 +204,10 @@ class GreenAPIClient:
             }
             
             self.logger.info(f"Sending message to chat {chat_id}")
-            response = requests.post(url, json=data)
+            response = self._post_json(url, data)
             response.raise_for_status()
             
-            result = response.json()
+            result = self._decode_json(response)
             self.logger.info(f"Message sent successfully with ID: {result.get('idMessage')}")
             return result
         
@@ -167,12 +216,13 @@ class GreenAPIClient:
             raise
     
     
-    # Cache for connection status to avoid hitting rate limits
-    _connection_cache = {
-        'timestamp': 0,
-        'status': False,
-        'message': ''
-    }
+    # Cache for connection status to avoid hitting rate limits.
+    # Shared by all client instances (endpoints create short-lived clients) and
+    # keyed by instance, so changed credentials are verified again.
+    _connection_cache: Dict[tuple, Dict[str, Any]] = {}
+    # Probes in flight per cache key; concurrent callers wait on the same Future
+    _connection_checks: Dict[tuple, Future] = {}
+    _connection_cache_lock = threading.Lock()
     _cache_duration = 60  # seconds
 
     def verify_connection(self, force_refresh: bool = False) -> tuple[bool, str]:
@@ -185,49 +235,83 @@ class GreenAPIClient:
         Returns:
             Tuple of (is_connected: bool, message: str)
         """
-        import time
+        cache_key = (self.base_url, self.id_instance, self.token_instance)
+        
+        # The lock only guards the cache; the HTTP probe runs outside it, and concurrent
+        # callers for the same instance share one in-flight probe instead of each sending one
+        with self._connection_cache_lock:
+            cached = self._connection_cache.get(cache_key)
+            
+            # Check cache
+            if not force_refresh and cached:
+                if time.time() - cached['timestamp'] < self._cache_duration:
+                    return cached['status'], cached['message']
+            
+            pending = self._connection_checks.get(cache_key)
+            if pending is None:
+                probe = self._connection_checks[cache_key] = Future()
+        
+        if pending is not None:
+            return pending.result()
+        
+        try:
+            result = self._probe_connection(cache_key, cached)
+        except BaseException as e:
+            probe.set_exception(e)
+            raise
+        else:
+            probe.set_result(result)
+            return result
+        finally:
+            with self._connection_cache_lock:
+                del self._connection_checks[cache_key]
+    
+    def _probe_connection(self, cache_key: tuple, cached: Optional[Dict[str, Any]]) -> tuple[bool, str]:
+        """
+        Query getStateInstance and cache the outcome for verify_connection
+        
+        Args:
+            cache_key: Connection cache key of this instance
+            cached: Previous cache entry (even if expired), used on rate limit
+            
+        Returns:
+            Tuple of (is_connected: bool, message: str)
+        """
+        def store(status: bool, message: str) -> tuple[bool, str]:
+            with self._connection_cache_lock:
+                self._connection_cache[cache_key] = {
+                    'timestamp': time.time(),
+                    'status': status,
+                    'message': message
+                }
+            return status, message
         
-        # Check cache
-        if not force_refresh:
-            current_time = time.time()
-            if current_time - self._connection_cache['timestamp'] < self._cache_duration:
-                return self._connection_cache['status'], self._connection_cache['message']
-
         try:
             # Check if credentials are configured
             if not self.id_instance or not self.token_instance:
                 # Update cache for this specific failure
-                self._connection_cache = {
-                    'timestamp': time.time(),
-                    'status': False,
-                    'message': "Green API credentials not configured"
-                }
-                return False, "Green API credentials not configured"
+                return store(False, "Green API credentials not configured")
             
             # Try to get account settings as a connectivity test
-            endpoint = f"getStateInstance/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}"
+            url = self._url("getStateInstance")
             
+            # Plain request without the session's Retry: callers share this probe, so a
+            # 429 must reach the cached-status fallback below instead of backing off
             response = requests.get(url, timeout=10)
             
             # Handle 429 specifically
             if response.status_code == 429:
                 self.logger.warning("Green API rate limit reached (429)")
                 # If we have a cached status (even if expired), return it with a warning
-                if self._connection_cache['timestamp'] > 0:
-                    return self._connection_cache['status'], f"{self._connection_cache['message']} (Cached - Rate Limit)"
+                if cached:
+                    return cached['status'], f"{cached['message']} (Cached - Rate Limit)"
                 
                 # Update cache for rate limit
-                self._connection_cache = {
-                    'timestamp': time.time(),
-                    'status': False,
-                    'message': "Rate limit reached. Please wait."
-                }
-                return False, "Rate limit reached. Please wait."
+                return store(False, "Rate limit reached. Please wait.")
 
             response.raise_for_status()
             
-            result = response.json()
+            result = self._decode_json(response)
             
             state = result.get('stateInstance')
             
@@ -245,14 +329,9 @@ class GreenAPIClient:
                 status, msg = False, f"Unknown state: {state}"
                 
             # Update cache
-            self._connection_cache = {
-                'timestamp': time.time(),
-                'status': status,
-                'message': msg
-            }
             self.logger.info(f"Green API connection verified successfully: {msg}")
-            return status, msg
-            
+            return store(status, msg)
+                
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Failed to verify Green API connection: {e}")
             return False, f"HTTP error: {e.response.status_code if hasattr(e, 'response') else 'Unknown'}"
@@ -262,13 +341,19 @@ class GreenAPIClient:
     
     def get_account_info(self) -> Dict[str, Any]:
         """Get account information from Green API"""
+        cached = self._get_cached(("getWaSettings",))
+        if cached is not None:
+            return cached
+        
         try:
-            endpoint = f"getWaSettings/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}"
+            url = self._url("getWaSettings")
             
-            response = requests.get(url)
+            response = self.session.get(url)
             response.raise_for_status()
-            return response.json()
+            account_info = self._decode_json(response)
+            
+            self._set_cached(("getWaSettings",), account_info, self.ACCOUNT_INFO_TTL)
+            return account_info
         
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Failed to get account info from Green API: {e}")
@@ -286,41 +371,18 @@ class GreenAPIClient:
             List of GreenAPIMessage objects
         """
         try:
-            endpoint = f"getChatHistory/{self.token_instance}"
-            url = f"{self.base_url}/waInstance{self.id_instance}/{endpoint}"
+            url = self._url("getChatHistory")
             
             payload = {
                 "chatId": chat_id,
                 "count": count
             }
             
-            response = requests.post(url, json=payload)
+            response = self._post_json(url, payload)
             response.raise_for_status()
             
-            messages_data = response.json()
-            messages = []
-            
-            for msg_data in messages_data:
-                # Convert snake_case to camelCase for our model
-                message = GreenAPIMessage(
-                    type=msg_data.get('type', ''),
-                    id_message=msg_data.get('idMessage', ''),
-                    timestamp=msg_data.get('timestamp', 0),
-                    type_message=msg_data.get('typeMessage', ''),
-                    chat_id=msg_data.get('chatId', ''),
-                    sender_id=msg_data.get('senderId'),
-                    sender_name=msg_data.get('senderName'),
-                    sender_contact_name=msg_data.get('senderContactName'),
-                    text_message=msg_data.get('textMessage'),
-                    is_forwarded=msg_data.get('isForwarded', False),
-                    forwarding_score=msg_data.get('forwardingScore', 0),
-                    download_url=msg_data.get('downloadUrl'),
-                    caption=msg_data.get('caption'),
-                    file_name=msg_data.get('fileName'),
-                    is_edited=msg_data.get('isEdited', False),
-                    is_deleted=msg_data.get('isDeleted', False)
-                )
-                messages.append(message)
+            messages_data = self._decode_json(response)
+            messages = self._parse_messages(messages_data)
             
             # Reverse to have oldest first
             messages.reverse()
@@ -330,4 +392,3 @@ class GreenAPIClient:
             self.logger.error(f"Failed to fetch chat history for {chat_id}: {e}")
             # Return empty list on error to allow continuing
             return []
-
@@ -1,19 +1,25 @@
 import logging
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import uvicorn
 from datetime import datetime
+from dataclasses import dataclass, asdict, replace
 import asyncio
+import hashlib
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from config import settings
 from whatsapp_bot import bot
 from database import db
 from ai_models import AVAILABLE_MODELS, get_models_by_provider, get_providers
 from cron_scheduler import scheduler
+import cache
 
 
 import os
@@ -40,28 +46,61 @@ logging.basicConfig(
     handlers=[file_handler, console_handler]
 )
 
-# Progress tracking
-analysis_progress = {
-    "status": "idle",
-    "progress": 0,
-    "message": "",
-    "details": "",
-    "start_time": None
-}
+# Progress tracking: readers grab the current snapshot, writers publish a new one
+@dataclass(frozen=True)
+class ProgressSnapshot:
+    """Immutable analysis progress state (replaced on every update, never mutated)"""
+    status: str = "idle"
+    progress: int = 0
+    message: str = ""
+    details: str = ""
+    start_time: Optional[datetime] = None
+
+analysis_progress = ProgressSnapshot()
+
+def publish_progress(**changes):
+    """Publish a new progress snapshot with the given fields changed"""
+    global analysis_progress
+    analysis_progress = replace(analysis_progress, **changes)
+
+# Hash of the localStorage config last validated and applied by /api/analyze
+_applied_config_hash: Optional[bytes] = None
 
 # Create FastAPI app
 app = FastAPI(
     title="WhatsApp Bot Dashboard",
     description="Dashboard for managing WhatsApp bot with Green API and OpenRouter integration",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# Worker threads for asyncio.to_thread: blocking Green API, OpenRouter and SQLite calls
+# all run there, so the default (cpu_count + 4) pool can be exhausted by a slow analysis
+BLOCKING_IO_WORKERS = 32
+
+@app.on_event("startup")
+async def configure_default_executor():
+    """Size the thread pool used for blocking calls offloaded from the event loop"""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+    )
+
+@app.on_event("shutdown")
+async def close_http_sessions():
+    """Release pooled Green API and OpenRouter connections"""
+    bot.green_client.close()
+    bot.openrouter_client.close()
+
 # Setup templates with custom filters
+@lru_cache(maxsize=4096)
+def _format_timestamp(timestamp: int) -> str:
+    """Format a unix timestamp (memoized, the same messages are rendered on every reload)"""
+    return datetime.fromtimestamp(timestamp).strftime('%H:%M %d/%m/%Y')
+
 def timestamp_to_datetime(timestamp):
     """Convert timestamp to readable datetime"""
     try:
-        dt = datetime.fromtimestamp(int(timestamp))
-        return dt.strftime('%H:%M %d/%m/%Y')
+        return _format_timestamp(int(timestamp))
     except:
         return timestamp
 
@@ -93,26 +132,34 @@ class CronScheduleUpdate(BaseModel):
 
 
 
+@cache.ttl_cache()
+def build_bot_stats() -> Dict[str, Any]:
+    """
+    In-memory bot stats merged with the latest stored report
+    
+    Cached briefly so dashboard/status polling doesn't re-read the database on
+    every request; callers must treat the returned dict as read-only.
+    """
+    bot_stats = bot.stats.model_dump()
+    
+    latest_report = db.get_latest_analysis_report()
+    if latest_report:
+        bot_stats["unanswered_conversations"] = latest_report.get("total_conversations", 0)
+        bot_stats["urgent_conversations"] = len(latest_report.get("urgent_conversations", []))
+    
+    return bot_stats
+
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Main dashboard page - NO Green API calls, only database"""
     try:
-        # Get stats from bot (in-memory, no API calls)
-        bot_stats = bot.stats.dict() if hasattr(bot, 'stats') else {
-            "total_messages": 0,
-            "unanswered_conversations": 0,
-            "urgent_conversations": 0,
-            "active_chats": 0
-        }
-        
-        # Get recent messages from database ONLY
-        recent_messages = bot.get_recent_messages(minutes=60, use_database=True)
-        
-        # Get latest report stats from database
-        latest_report = db.get_latest_analysis_report()
-        if latest_report:
-            bot_stats["unanswered_conversations"] = latest_report.get("total_conversations", 0)
-            bot_stats["urgent_conversations"] = len(latest_report.get("urgent_conversations", []))
+        # Get stats from bot and latest report (no API calls), off the event loop
+        bot_stats, recent_messages = await asyncio.gather(
+            asyncio.to_thread(build_bot_stats),
+            # Get recent messages from database ONLY
+            asyncio.to_thread(bot.get_recent_messages, minutes=60, use_database=True, limit=10)
+        )
         
         return templates.TemplateResponse("dashboard_new.html", {
             "request": request,
@@ -120,7 +167,7 @@ async def dashboard(request: Request):
                 "account_status": "cached",
                 "bot_stats": bot_stats
             },
-            "recent_messages": recent_messages[:10],  # Show last 10 messages
+            "recent_messages": recent_messages,  # Last 10 messages
             "stats": bot_stats,
             "settings": {
                 "green_api_url": settings.green_api_url,
@@ -141,20 +188,25 @@ async def dashboard(request: Request):
 @app.post("/api/analyze")
 async def analyze_messages(request: AnalysisRequest, background_tasks: BackgroundTasks):
     """Trigger message analysis with progress tracking"""
-    global analysis_progress
+    global _applied_config_hash
     
-    # Apply config from localStorage if provided
+    # Apply config from localStorage if provided (skipped when it's the config already applied)
     if request.config:
-        from config_injector import config_injector
-        is_valid, error_msg = config_injector.validate_config(request.config)
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=error_msg)
-        config_injector.apply_config(request.config)
+        config_hash = hashlib.blake2b(
+            orjson.dumps(request.config, option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).digest()
+        if config_hash != _applied_config_hash:
+            from config_injector import config_injector
+            is_valid, error_msg = config_injector.validate_config(request.config)
+            if not is_valid:
+                raise HTTPException(status_code=400, detail=error_msg)
+            config_injector.apply_config(request.config)
+            _applied_config_hash = config_hash
     
     # Verify Green API connection before proceeding
     from green_api_client import GreenAPIClient
-    client = GreenAPIClient()
-    is_connected, connection_msg = client.verify_connection()
+    with GreenAPIClient() as client:
+        is_connected, connection_msg = await asyncio.to_thread(client.verify_connection)
     
     if not is_connected:
         raise HTTPException(
@@ -163,13 +215,13 @@ async def analyze_messages(request: AnalysisRequest, background_tasks: Backgroun
         )
     
     # Reset progress
-    analysis_progress = {
-        "status": "starting",
-        "progress": 0,
-        "message": "מתחיל ניתוח...",
-        "details": "מתחבר ל-Green API",
-        "start_time": datetime.now()
-    }
+    publish_progress(
+        status="starting",
+        progress=0,
+        message="מתחיל ניתוח...",
+        details="מתחבר ל-Green API",
+        start_time=datetime.now()
+    )
     
     try:
         # Run analysis in background with progress updates
@@ -179,38 +231,36 @@ async def analyze_messages(request: AnalysisRequest, background_tasks: Backgroun
             progress_callback=update_progress
         )
         
+        # In-memory bot stats changed even if nothing new was written to the database
+        cache.invalidate()
+        
         # Final progress update
-        analysis_progress.update({
-            "status": "completed",
-            "progress": 100,
-            "message": "✅ ניתוח הסתיים בהצלחה!",
-            "details": f"נמצאו {result.get('report', {}).get('total_conversations', 0)} שיחות פתוחות"
-        })
+        publish_progress(
+            status="completed",
+            progress=100,
+            message="✅ ניתוח הסתיים בהצלחה!",
+            details=f"נמצאו {result.get('report', {}).get('total_conversations', 0)} שיחות פתוחות"
+        )
         
         return result
     except Exception as e:
         logging.error(f"Error in analysis: {e}")
-        analysis_progress.update({
-            "status": "error",
-            "progress": 100,
-            "message": "❌ שגיאה בניתוח",
-            "details": str(e)
-        })
+        publish_progress(
+            status="error",
+            progress=100,
+            message="❌ שגיאה בניתוח",
+            details=str(e)
+        )
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/progress")
 async def get_analysis_progress():
     """Get current analysis progress"""
-    return analysis_progress
+    return asdict(analysis_progress)
 
 def update_progress(progress: int, message: str, details: str = ""):
     """Update analysis progress"""
-    global analysis_progress
-    analysis_progress.update({
-        "progress": progress,
-        "message": message,
-        "details": details
-    })
+    publish_progress(progress=progress, message=message, details=details)
     logging.info(f"Progress: {progress}% - {message} - {details}")
 
 
@@ -233,18 +283,7 @@ async def get_status():
     """Get current bot status - NO Green API calls, only cached data"""
     try:
         # Get stats from memory and database - NO API CALLS
-        bot_stats = bot.stats.dict() if hasattr(bot, 'stats') else {
-            "total_messages": 0,
-            "unanswered_conversations": 0,
-            "urgent_conversations": 0,
-            "active_chats": 0
-        }
-        
-        # Update from latest report in database
-        latest_report = db.get_latest_analysis_report()
-        if latest_report:
-            bot_stats["unanswered_conversations"] = latest_report.get("total_conversations", 0)
-            bot_stats["urgent_conversations"] = len(latest_report.get("urgent_conversations", []))
+        bot_stats = await asyncio.to_thread(build_bot_stats)
         
         # Get cron status
         from cron_scheduler import scheduler
@@ -270,11 +309,10 @@ async def get_messages(minutes: int = 60, use_database: bool = True, exclude_gro
     """Get recent messages - ALWAYS from database by default"""
     try:
         # Force database usage to avoid API calls
-        messages = bot.get_recent_messages(minutes=minutes, use_database=True)
-        
-        # Filter out group messages if requested
-        if exclude_groups:
-            messages = [msg for msg in messages if not (msg.get('chat_id', '').endswith('@g.us'))]
+        # Group messages are filtered out in SQL when requested
+        messages = await asyncio.to_thread(
+            bot.get_recent_messages, minutes=minutes, use_database=True, exclude_groups=exclude_groups
+        )
         
         return {"success": True, "messages": messages}
     except Exception as e:
@@ -291,8 +329,8 @@ async def refresh_from_green(minutes: int = 60):
     try:
         # Verify Green API connection before proceeding
         from green_api_client import GreenAPIClient
-        client = GreenAPIClient()
-        is_connected, connection_msg = client.verify_connection()
+        with GreenAPIClient() as client:
+            is_connected, connection_msg = await asyncio.to_thread(client.verify_connection)
         
         if not is_connected:
             raise HTTPException(
@@ -303,7 +341,7 @@ async def refresh_from_green(minutes: int = 60):
         logging.info(f"Manual refresh from Green API requested for last {minutes} minutes")
         
         # Fetch from Green API and store in database
-        messages = bot.get_recent_messages(minutes=minutes, use_database=False)
+        messages = await asyncio.to_thread(bot.get_recent_messages, minutes=minutes, use_database=False)
         
         return {
             "success": True,
@@ -313,11 +351,8 @@ async def refresh_from_green(minutes: int = 60):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
         error_msg = str(e) if str(e) else repr(e)
-        error_trace = traceback.format_exc()
-        logging.error(f"Error refreshing from Green API: {error_msg}")
-        logging.error(f"Traceback: {error_trace}")
+        logging.exception(f"Error refreshing from Green API: {error_msg}")
         raise HTTPException(
             status_code=500, 
             detail=f"Error fetching messages: {error_msg}" if error_msg else "Unknown error occurred"
@@ -328,7 +363,7 @@ async def refresh_from_green(minutes: int = 60):
 async def get_database_stats():
     """Get database statistics"""
     try:
-        stats = bot.get_database_stats()
+        stats = await asyncio.to_thread(cache.cached_call, bot.get_database_stats)
         return {"success": True, "stats": stats}
     except Exception as e:
         logging.error(f"Error getting database stats: {e}")
@@ -340,26 +375,29 @@ async def get_urgent_conversations():
     """Get urgent conversations with their last 4 messages"""
     try:
         # Get the latest analysis report from database
-        latest_report = db.get_latest_analysis_report()
+        latest_report = await asyncio.to_thread(db.get_latest_analysis_report)
         
         if not latest_report:
             return {"success": True, "conversations": []}
         
-        urgent_convs = []
+        urgent_report = latest_report.get('urgent_conversations', [])
         
-        # Get urgent conversations from the report
-        for conv_data in latest_report.get('urgent_conversations', []):
-            chat_id = conv_data.get('chat_id')
-            
-            # Get last 4 messages for this chat from database
-            messages = db.get_messages_by_chat(chat_id, limit=4)
-            
-            urgent_convs.append({
-                'chat_id': chat_id,
+        # Get last 4 messages for every urgent chat in one query
+        messages_by_chat = await asyncio.to_thread(
+            db.get_last_messages_per_chat,
+            [conv_data.get('chat_id') for conv_data in urgent_report],
+            4
+        )
+        
+        urgent_convs = [
+            {
+                'chat_id': conv_data.get('chat_id'),
                 'chat_name': conv_data.get('chat_name'),
                 'reason': conv_data.get('reason'),
-                'messages': messages
-            })
+                'messages': messages_by_chat[conv_data.get('chat_id')]
+            }
+            for conv_data in urgent_report
+        ]
         
         return {"success": True, "conversations": urgent_convs}
     except Exception as e:
@@ -370,6 +408,11 @@ async def get_urgent_conversations():
 @app.post("/api/config")
 async def update_config(request: ConfigUpdate):
     """Update configuration (in-memory only for demo)"""
+    global _applied_config_hash
+    
+    # Settings may now differ from the last applied localStorage config
+    _applied_config_hash = None
+    
     try:
         updates = {}
         
@@ -418,8 +461,8 @@ async def verify_connection_endpoint(force: bool = False):
         from green_api_client import GreenAPIClient
         
         # Create client with current settings
-        client = GreenAPIClient()
-        is_connected, message = client.verify_connection(force_refresh=force)
+        with GreenAPIClient() as client:
+            is_connected, message = await asyncio.to_thread(client.verify_connection, force_refresh=force)
         
         return {
             "success": True,
@@ -466,7 +509,8 @@ async def test_openrouter_key(api_key: str = None):
             "max_tokens": 5
         }
         
-        response = requests.post(
+        response = await asyncio.to_thread(
+            requests.post,
             "https://openrouter.ai/api/v1/chat/completions",
             headers=headers,
             json=data,
@@ -565,9 +609,13 @@ async def health_check():
 
 
 if __name__ == "__main__":
+    # Single worker on purpose: analysis progress, bot stats and the cron scheduler
+    # live in this process. uvicorn[standard] provides uvloop and httptools, which
+    # the default "auto" loop/http settings pick up.
     uvicorn.run(
         "main:app",
         host=settings.app_host,
         port=settings.app_port,
-        reload=settings.debug
+        reload=settings.debug,
+        workers=1
     )
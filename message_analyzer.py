@@ -1,11 +1,30 @@
 import logging
-from typing import List, Dict, Tuple
+from typing import Iterable, Iterator, List, Dict, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from functools import lru_cache
+from itertools import groupby
+from operator import attrgetter
 from models import GreenAPIMessage, ChatConversation
 from config import settings
 
 
+_by_chat_id = attrgetter('chat_id')
+_by_chat_and_timestamp = attrgetter('chat_id', 'timestamp')
+_by_last_message_time = attrgetter('last_message_time')
+
+# Green API message type for messages sent to me
+_INCOMING = "incoming"
+
+# Sender label per message type in conversation summaries (anything else is me)
+_SENDER_LABELS = {_INCOMING: "את/ה"}
+
+
+@lru_cache(maxsize=1024)
+def _fmt_hm(timestamp: int) -> str:
+    """Format a unix timestamp as HH:MM (memoized, messages repeat across analysis runs)"""
+    return datetime.fromtimestamp(timestamp).strftime("%H:%M")
+
+
 class MessageAnalyzer:
     """Analyzes WhatsApp messages to identify open conversations and prioritize them"""
     
@@ -13,34 +32,31 @@ class MessageAnalyzer:
         self.logger = logging.getLogger(__name__)
         self.max_messages_per_chat = settings.max_messages_per_chat
     
-    def group_messages_by_chat(self, messages: List[GreenAPIMessage]) -> List[ChatConversation]:
+    def iter_conversations(self, messages: Iterable[GreenAPIMessage]) -> Iterator[Tuple[ChatConversation, tuple]]:
         """
-        Group messages by chat ID and create conversation objects
+        Group messages by chat ID, yielding each conversation with its database row
         
         Args:
-            messages: List of messages to group
+            messages: Messages to group (any iterable, consumed once)
         
-        Returns:
-            List of ChatConversation objects
+        Yields:
+            (ChatConversation, (chat_id, chat_name, last_message_time, message_count,
+            is_unanswered)) per chat, in chat ID order; the row is ready for
+            db.bulk_update_conversations
         """
-        chat_groups = defaultdict(list)
-        
-        # Group messages by chat_id
-        for message in messages:
-            chat_groups[message.chat_id].append(message)
+        # One stable sort puts every chat's messages together, oldest first
+        sorted_messages = sorted(messages, key=_by_chat_and_timestamp)
         
-        conversations = []
+        conversation_count = 0
         
         # Create conversation objects for each chat
-        for chat_id, chat_messages in chat_groups.items():
+        for chat_id, chat_messages in groupby(sorted_messages, key=_by_chat_id):
             # Check if group chats should be analyzed
             if not settings.analyze_group_chats and chat_id.endswith('@g.us'):
                 continue
-            # Sort messages by timestamp (oldest first)
-            chat_messages.sort(key=lambda x: x.timestamp)
             
             # Get the last N messages for analysis
-            recent_messages = chat_messages[-self.max_messages_per_chat:]
+            recent_messages = list(chat_messages)[-self.max_messages_per_chat:]
             
             # Extract chat name from the most recent message
             chat_name = None
@@ -48,20 +64,36 @@ class MessageAnalyzer:
                 last_msg = recent_messages[-1]
                 chat_name = last_msg.sender_contact_name or last_msg.sender_name
             
+            message_count = len(recent_messages)
+            last_message_time = recent_messages[-1].datetime if message_count else datetime.now()
+            is_unanswered = self._is_conversation_unanswered(recent_messages)
+            
             conversation = ChatConversation(
                 chat_id=chat_id,
                 chat_name=chat_name,
                 messages=recent_messages,
-                last_message_time=recent_messages[-1].datetime if recent_messages else datetime.now(),
-                is_unanswered=self._is_conversation_unanswered(recent_messages)
+                last_message_time=last_message_time,
+                is_unanswered=is_unanswered,
+                message_count=message_count
             )
             
-            conversations.append(conversation)
+            conversation_count += 1
+            yield conversation, (chat_id, chat_name, last_message_time, message_count, is_unanswered)
         
-        # Sort conversations by last message time (most recent first)
-        conversations.sort(key=lambda x: x.last_message_time, reverse=True)
+        self.logger.info(f"Grouped {len(sorted_messages)} messages into {conversation_count} conversations")
+    
+    def group_messages_by_chat(self, messages: Iterable[GreenAPIMessage]) -> List[ChatConversation]:
+        """
+        Group messages by chat ID and create conversation objects
         
-        self.logger.info(f"Grouped {len(messages)} messages into {len(conversations)} conversations")
+        Args:
+            messages: Messages to group (any iterable, consumed once)
+        
+        Returns:
+            List of ChatConversation objects, most recent first
+        """
+        conversations = [conversation for conversation, _ in self.iter_conversations(messages)]
+        conversations.sort(key=_by_last_message_time, reverse=True)
         return conversations
     
     def _is_conversation_unanswered(self, messages: List[GreenAPIMessage]) -> bool:
@@ -88,7 +120,7 @@ class MessageAnalyzer:
         # self.logger.debug(f"Checking conversation status. Last message type: {last_message.type}, Chat ID: {last_message.chat_id}")
         
         # If the last message is incoming (from someone else), it's unanswered
-        if last_message.type == "incoming":
+        if last_message.type == _INCOMING:
             return True
         
         # If the last message is outgoing (from me), check if there was an incoming message after my last outgoing
@@ -125,25 +157,25 @@ class MessageAnalyzer:
         Returns:
             Dictionary with conversation summary
         """
-        messages_text = []
+        messages_text = [None] * len(conversation.messages)
         
         for i, msg in enumerate(conversation.messages):
-            sender = "את/ה" if msg.type == "incoming" else "אני"
-            timestamp = msg.datetime.strftime("%H:%M")
+            sender = _SENDER_LABELS.get(msg.type, "אני")
+            timestamp = _fmt_hm(msg.timestamp)
             
             if msg.text_message:
-                messages_text.append(f"[{timestamp}] {sender}: {msg.text_message}")
+                messages_text[i] = f"[{timestamp}] {sender}: {msg.text_message}"
             elif msg.caption:
-                messages_text.append(f"[{timestamp}] {sender}: (מדיה) {msg.caption}")
+                messages_text[i] = f"[{timestamp}] {sender}: (מדיה) {msg.caption}"
             else:
-                messages_text.append(f"[{timestamp}] {sender}: (הודעת מדיה)")
+                messages_text[i] = f"[{timestamp}] {sender}: (הודעת מדיה)"
         
         return {
             "chat_id": conversation.chat_id,
             "chat_name": conversation.chat_name or "לא ידוע",
             "last_message_time": conversation.last_message_time.strftime("%Y-%m-%d %H:%M"),
             "messages": messages_text,
-            "message_count": len(conversation.messages),
+            "message_count": conversation.message_count,
             "is_unanswered": conversation.is_unanswered
         }
     
@@ -157,21 +189,11 @@ class MessageAnalyzer:
         Returns:
             List of conversations sorted by priority
         """
-        now = datetime.now()
-        
-        def get_priority_score(conv: ChatConversation) -> float:
-            # Calculate hours since last message
-            hours_since_last = (now - conv.last_message_time).total_seconds() / 3600
-            
-            # Higher score for older unanswered messages
-            return hours_since_last
-        
-        # Sort by priority score (higher = more urgent)
-        prioritized = sorted(conversations, key=get_priority_score, reverse=True)
-        
-        return prioritized
+        # Longest-waiting first: hours since the last message grow as last_message_time
+        # shrinks, so sorting oldest-first gives the same order without any date math
+        return sorted(conversations, key=_by_last_message_time)
     
-    def analyze_conversations(self, messages: List[GreenAPIMessage]) -> Tuple[List[ChatConversation], List[Dict]]:
+    def analyze_conversations(self, messages: List[GreenAPIMessage]) -> Tuple[List[ChatConversation], List[Dict], List[tuple]]:
         """
         Main analysis function - processes messages and returns prioritized conversations
         
@@ -179,10 +201,16 @@ class MessageAnalyzer:
             messages: List of messages to analyze
         
         Returns:
-            Tuple of (all conversations, open conversation summaries)
+            Tuple of (all conversations, open conversation summaries, conversation database
+            rows for db.bulk_update_conversations)
         """
-        # Group messages by chat
-        all_conversations = self.group_messages_by_chat(messages)
+        # Group messages by chat, collecting the database rows in the same pass
+        all_conversations = []
+        conversation_rows = []
+        for conversation, row in self.iter_conversations(messages):
+            all_conversations.append(conversation)
+            conversation_rows.append(row)
+        all_conversations.sort(key=_by_last_message_time, reverse=True)
         
         # Identify open conversations
         open_conversations = self.identify_open_conversations(all_conversations)
@@ -195,4 +223,4 @@ class MessageAnalyzer:
             self.get_conversation_summary(conv) for conv in prioritized_open
         ]
         
-        return all_conversations, conversation_summaries
+        return all_conversations, conversation_summaries, conversation_rows
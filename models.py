@@ -1,28 +1,33 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class GreenAPIMessage(BaseModel):
-    """Model for Green API message"""
-    type: str
-    id_message: str
-    timestamp: int
-    type_message: str
-    chat_id: str
-    sender_id: Optional[str] = None
-    sender_name: Optional[str] = None
-    sender_contact_name: Optional[str] = None
-    text_message: Optional[str] = None
-    is_forwarded: Optional[bool] = False
-    forwarding_score: Optional[int] = 0
+    """Model for Green API message (accepts both snake_case and Green API camelCase keys)"""
+    # Messages are read-only after parsing; frozen also makes them hashable
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+    
+    # Defaults match the old per-key .get() fallbacks, so one incomplete item
+    # can't fail validation of a whole Green API payload
+    type: str = ''
+    id_message: str = Field('', alias="idMessage")
+    timestamp: int = 0
+    type_message: str = Field('', alias="typeMessage")
+    chat_id: str = Field('', alias="chatId")
+    sender_id: Optional[str] = Field(None, alias="senderId")
+    sender_name: Optional[str] = Field(None, alias="senderName")
+    sender_contact_name: Optional[str] = Field(None, alias="senderContactName")
+    text_message: Optional[str] = Field(None, alias="textMessage")
+    is_forwarded: Optional[bool] = Field(False, alias="isForwarded")
+    forwarding_score: Optional[int] = Field(0, alias="forwardingScore")
     
     # Additional fields for different message types
-    download_url: Optional[str] = None
+    download_url: Optional[str] = Field(None, alias="downloadUrl")
     caption: Optional[str] = None
-    file_name: Optional[str] = None
-    is_edited: Optional[bool] = False
-    is_deleted: Optional[bool] = False
+    file_name: Optional[str] = Field(None, alias="fileName")
+    is_edited: Optional[bool] = Field(False, alias="isEdited")
+    is_deleted: Optional[bool] = Field(False, alias="isDeleted")
     
     @property
     def datetime(self) -> datetime:
@@ -42,6 +47,7 @@ class ChatConversation(BaseModel):
     messages: List[GreenAPIMessage]
     last_message_time: datetime
     is_unanswered: bool = False
+    message_count: int = 0  # len(messages), stored once when the conversation is built
     
     @property
     def last_message(self) -> Optional[GreenAPIMessage]:
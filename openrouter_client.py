@@ -1,38 +1,119 @@
+import ast
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import re
+import orjson
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from config import settings
 from models import OpenRouterRequest, OpenRouterResponse, PriorityReport
 
 
-class OpenRouterClient:
-    """Client for interacting with OpenRouter API"""
+# JSON repair patterns for AI responses, compiled once
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+_INNER_QUOTE_RE = re.compile(r'(?<=\w)"(?=\w)')
+# Quoted strings (kept as-is) or bare JSON keywords (converted for ast.literal_eval)
+_JSON_LITERAL_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|\b(?:null|true|false)\b')
+_PYTHON_LITERALS = {'null': 'None', 'true': 'True', 'false': 'False'}
+# Structural tokens for _repair_json: a whole string (group 1 holds its closing
+# quote, empty if truncated) or a single bracket/brace
+_JSON_STRUCTURE_RE = re.compile(r'"(?:[^"\\]|\\.)*("?)|[{}\[\]]', re.DOTALL)
+_JSON_CLOSERS = {'{': '}', '[': ']'}
+
+
+def _to_python_literal(match: re.Match) -> str:
+    """Map a JSON keyword to its Python spelling; strings pass through unchanged"""
+    token = match.group(0)
+    return _PYTHON_LITERALS.get(token, token)
+
+# Tabs and newlines inside a cell would break the prompt table layout
+_CELL_SEPARATORS = str.maketrans({'\t': ' ', '\n': ' ', '\r': ' '})
+
+
+def _table_cell(value: Any) -> str:
+    """Render a conversation summary value as a single tab-free table cell"""
+    if isinstance(value, list):
+        value = " | ".join(map(str, value))
+    return str(value).translate(_CELL_SEPARATORS)
+
+
+# WhatsApp chat ID suffixes (personal or group chat), both 5 characters long
+_CHAT_ID_SUFFIXES = ('@c.us', '@g.us')
+
+
+def _strip_suffix(chat_id: str) -> str:
+    """Remove the WhatsApp suffix from a chat ID, leaving the phone/group number"""
+    return chat_id[:-5] if chat_id.endswith(_CHAT_ID_SUFFIXES) else chat_id
+
+
+# Fixed report text, built once instead of per report
+_UNKNOWN_NAME = 'לא ידוע'
+_PRIORITY_SECTIONS = (
+    ("🚨 *שיחות דחופות:*", "urgent_conversations"),
+    ("⭐ *שיחות חשובות:*", "important_conversations"),
+)
+_NORMAL_HEADER = "📝 *שיחות רגילות:*"
+_NORMAL_PREVIEW = 3  # Show only the first few normal conversations
+
+
+def _format_priority_entry(conv: Dict[str, Any]) -> str:
+    """Format an urgent/important conversation as its WhatsApp link line plus reason line"""
+    chat_id = conv.get('chat_id', '')
+    chat_name = conv.get('chat_name', _UNKNOWN_NAME)
+    reason = conv.get('reason', '')
     
-    def __init__(self):
-        self.api_key = settings.openrouter_api_key
-        self.model = settings.openrouter_model
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.logger = logging.getLogger(__name__)
+    # Groups have no wa.me link
+    if chat_id.endswith('@g.us'):
+        return f"• {chat_name} (קבוצה)\n  📌 סיבה: {reason}"
     
-    def _create_analysis_prompt(self, conversation_summaries: List[Dict]) -> str:
-        """
-        Create a prompt for AI to analyze and prioritize conversations
-        
-        Args:
-            conversation_summaries: List of conversation summaries
-        
-        Returns:
-            Prompt string for the AI
-        """
-        conversations_text = json.dumps(conversation_summaries, ensure_ascii=False, indent=2)
-        
-        prompt = f"""
-אתה עוזר אישי חכם לניהול הודעות ווצאפ. אנא אנלז את השיחות הפתוחות הבאות ודרג אותן לפי דחיפות.
+    phone = _strip_suffix(chat_id)
+    return f"• {chat_name} ({phone})\n  💬 https://wa.me/{phone}\n  📌 סיבה: {reason}"
 
-שיחות פתוחות לניתוח:
-{conversations_text}
+
+def _summary_lines(report: PriorityReport):
+    """Yield the lines of the WhatsApp summary report"""
+    created_at = datetime.now().strftime('%Y-%m-%d %H:%M')
+    
+    yield "📊 *דוח שיחות פתוחות*"
+    yield f"📅 נוצר בתאריך: {created_at}"
+    yield f"📈 סה\"כ שיחות פתוחות: {report.total_conversations}"
+    yield ""
+    
+    for title, field in _PRIORITY_SECTIONS:
+        conversations = getattr(report, field)
+        if conversations:
+            yield title
+            yield from map(_format_priority_entry, conversations)
+            yield ""
+    
+    normal = report.normal_conversations
+    if normal:
+        yield _NORMAL_HEADER
+        for conv in islice(normal, _NORMAL_PREVIEW):
+            yield f"• {conv.get('chat_name', _UNKNOWN_NAME)} ({_strip_suffix(conv.get('chat_id', ''))})"
+        if len(normal) > _NORMAL_PREVIEW:
+            yield f"• ועוד {len(normal) - _NORMAL_PREVIEW} שיחות רגילות..."
+        yield ""
+    
+    yield "📋 *סיכום:*"
+    yield report.summary
+
+
+class OpenRouterClient:
+    """Client for interacting with OpenRouter API"""
+    
+    # Static instructions and output schema, sent first and unchanged on every call so
+    # providers can serve the prefix from their prompt cache
+    SYSTEM_PROMPT = """אתה עוזר אישי חכם לניהול הודעות ווצאפ. אנא אנלז את השיחות הפתוחות שתקבל ודרג אותן לפי דחיפות.
 
 אנא בצע את הפעולות הבאות:
 1. זהה שיחות דחופות שדורשות תגובה מיידית (למשל: חירום, בקשות חשובות, שאלות שקשורות לעסק/עבודה)
@@ -40,38 +121,206 @@ class OpenRouterClient:
 3. סווג את השאר כשיחות רגילות שניתן לענות עליהן מאוחר יותר
 
 החזר תגובה בפורמט JSON הבא בלבד:
-{{
+{
     "urgent_conversations": [
-        {{
+        {
             "chat_id": "מזהה צ'אט",
             "chat_name": "שם הצ'אט",
             "reason": "סיבה לדחיפות",
             "suggested_response": "הצעה לתגובה מתאימה"
-        }}
+        }
     ],
     "important_conversations": [
-        {{
+        {
             "chat_id": "מזהה צ'אט",
             "chat_name": "שם הצ'אט",
             "reason": "סיבה לחשיבות",
             "suggested_response": "הצעה לתגובה מתאימה"
-        }}
+        }
     ],
     "normal_conversations": [
-        {{
+        {
             "chat_id": "מזהה צ'אט",
             "chat_name": "שם הצ'אט",
             "reason": "סיבה לסיווג"
-        }}
+        }
     ],
     "summary": "סיכום כללי של המצב והמלצות לפעולה",
     "total_conversations": מספר כולל של שיחות
-}}
+}
+
+השיחות מגיעות כטבלה מופרדת בטאבים: שורת כותרת ואחריה שורה לכל שיחה.
+כל שורה: chat_id TAB chat_name TAB last_message_time TAB message_count TAB is_unanswered TAB messages
+בעמודת messages ההודעות מופרדות ב-" | ", מהישנה לחדשה.
 
 הערה: עבור "normal_conversations", אל תחזיר "suggested_response". תחזיר רק עבור שיחות דחופות וחשובות.
 חשוב: החזר רק JSON תקין, בלי טקסט נוסף.
 """
-        return prompt
+    
+    # System message serialized once; the static prompt never changes between calls
+    _SYSTEM_MESSAGE_JSON = orjson.dumps({
+        "role": "system",
+        "content": [
+            {
+                "type": "text",
+                "text": SYSTEM_PROMPT,
+                # Honored by providers with explicit prompt caching (e.g. Anthropic)
+                "cache_control": {"type": "ephemeral"}
+            }
+        ]
+    })
+    
+    # Columns of the per-call conversation table; keys are named once in the header
+    # row instead of being repeated for every conversation
+    PROMPT_COLUMNS = ("chat_id", "chat_name", "last_message_time", "message_count", "is_unanswered", "messages")
+    _USER_PROMPT_HEADER = "שיחות פתוחות לניתוח:\n" + "\t".join(PROMPT_COLUMNS)
+    
+    # Identical summaries sent to the same model reuse the earlier analysis
+    ANALYSIS_CACHE_SIZE = 128
+    ANALYSIS_CACHE_TTL = 7 * 24 * 3600  # seconds
+    
+    def __init__(self):
+        self.api_key = settings.openrouter_api_key
+        self.model = settings.openrouter_model
+        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.logger = logging.getLogger(__name__)
+        
+        # Pooled session keeps the TLS connection to OpenRouter warm between analyses.
+        # Authorization is sent per request because the key can be changed at runtime.
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://whatsapp-bot.local",
+            "X-Title": "WhatsApp Bot Assistant"
+        })
+        # Rate limits and upstream overload are transient, so the completion POST is retried
+        # with backoff (honoring Retry-After), as are connection errors such as a pooled
+        # socket that went stale while idle. Read errors are never retried: a slow
+        # generation may already be billed and would block for another full read timeout.
+        retries = Retry(
+            total=2,
+            connect=2,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+        
+        # key -> (expiry, analysis_result), least recently used first
+        self._analysis_cache: OrderedDict = OrderedDict()
+        self._analysis_cache_lock = threading.Lock()
+        
+        # Running totals of provider prompt-cache tokens, to verify the static system prompt is being cached
+        self.prompt_cache_tokens = {"hit": 0, "miss": 0}
+        self._usage_lock = threading.Lock()
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        self._session.close()
+    
+    @staticmethod
+    def _analysis_cache_key(conversation_summaries: List[Dict], model: str, temperature: float) -> str:
+        """Build a stable cache key from the canonicalized summaries and request parameters"""
+        payload = orjson.dumps(conversation_summaries, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(f"{model}|{temperature}|".encode("utf-8") + payload).hexdigest()
+    
+    def _get_cached_analysis(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached analysis result, or None if missing or expired"""
+        with self._analysis_cache_lock:
+            entry = self._analysis_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._analysis_cache[key]
+                return None
+            self._analysis_cache.move_to_end(key)
+            return entry[1]
+    
+    def _cache_analysis(self, key: str, analysis_result: Dict[str, Any]):
+        """Store an analysis result, evicting the least recently used entry when full"""
+        with self._analysis_cache_lock:
+            self._analysis_cache[key] = (time.monotonic() + self.ANALYSIS_CACHE_TTL, analysis_result)
+            self._analysis_cache.move_to_end(key)
+            while len(self._analysis_cache) > self.ANALYSIS_CACHE_SIZE:
+                self._analysis_cache.popitem(last=False)
+    
+    def _record_cache_usage(self, usage: Dict[str, Any]):
+        """
+        Log prompt-cache hit/miss token counts reported by the provider
+        
+        Args:
+            usage: The "usage" object of an OpenRouter response
+        """
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        details = usage.get("prompt_tokens_details") or {}
+        # Field names differ by upstream provider (OpenAI-style, Anthropic, DeepSeek)
+        hit = (details.get("cached_tokens")
+               or usage.get("cache_read_input_tokens")
+               or usage.get("prompt_cache_hit_tokens")
+               or 0)
+        miss = usage.get("prompt_cache_miss_tokens")
+        if miss is None:
+            miss = max(prompt_tokens - hit, 0)
+        
+        with self._usage_lock:
+            self.prompt_cache_tokens["hit"] += hit
+            self.prompt_cache_tokens["miss"] += miss
+        
+        self.logger.info(f"Prompt cache: cache_hit_tokens={hit} cache_miss_tokens={miss}")
+        if prompt_tokens and not hit:
+            self.logger.debug("No cached prompt tokens reported; the model may be routed to a non-caching provider")
+    
+    @staticmethod
+    def _build_report(analysis_result: Dict[str, Any]) -> PriorityReport:
+        """Create a PriorityReport from a parsed AI analysis result"""
+        return PriorityReport(
+            urgent_conversations=analysis_result.get("urgent_conversations", []),
+            important_conversations=analysis_result.get("important_conversations", []),
+            normal_conversations=analysis_result.get("normal_conversations", []),
+            summary=analysis_result.get("summary", ""),
+            total_conversations=analysis_result.get("total_conversations", 0)
+        )
+    
+    def _create_analysis_prompt(self, conversation_summaries: List[Dict]) -> str:
+        """
+        Create the per-call user message with the conversations to analyze
+        (the instructions live in SYSTEM_PROMPT)
+        
+        Args:
+            conversation_summaries: List of conversation summaries
+        
+        Returns:
+            Prompt string for the AI
+        """
+        rows = [self._USER_PROMPT_HEADER]
+        rows.extend(
+            "\t".join(_table_cell(summary.get(column, "")) for column in self.PROMPT_COLUMNS)
+            for summary in conversation_summaries
+        )
+        return "\n".join(rows)
+    
+    def _build_request_body(self, model: str, prompt: str, temperature: float) -> bytes:
+        """
+        Serialize the chat completion request around the pre-encoded system message
+        
+        Args:
+            model: OpenRouter model identifier
+            prompt: Per-call user message
+            temperature: Sampling temperature
+        
+        Returns:
+            JSON request body
+        """
+        return b"".join((
+            b'{"model":', orjson.dumps(model),
+            b',"messages":[', self._SYSTEM_MESSAGE_JSON,
+            b',', orjson.dumps({"role": "user", "content": prompt}),
+            b'],"max_tokens":4000,"temperature":', orjson.dumps(temperature),
+            b'}'
+        ))
     
     def analyze_conversations(self, conversation_summaries: List[Dict]) -> PriorityReport:
         """
@@ -92,37 +341,32 @@ class OpenRouterClient:
                 total_conversations=0
             )
         
+        temperature = 0.1
+        cache_key = self._analysis_cache_key(conversation_summaries, settings.openrouter_model, temperature)
+        cached_result = self._get_cached_analysis(cache_key)
+        if cached_result is not None:
+            self.logger.info(f"Reusing cached analysis for {len(conversation_summaries)} unchanged conversations")
+            return self._build_report(cached_result)
+        
         try:
             # Create the prompt
             prompt = self._create_analysis_prompt(conversation_summaries)
             
-            # Prepare the request
-            request_data = {
-                "model": settings.openrouter_model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 4000,
-                "temperature": 0.1
-            }
+            # Prepare the request; only the user message is serialized per call
+            body = self._build_request_body(settings.openrouter_model, prompt, temperature)
             
-            headers = {
-                "Authorization": f"Bearer {settings.openrouter_api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://whatsapp-bot.local",
-                "X-Title": "WhatsApp Bot Assistant"
-            }
+            headers = {"Authorization": f"Bearer {settings.openrouter_api_key}"}
             
             self.logger.info(f"Sending {len(conversation_summaries)} conversations to OpenRouter for analysis")
             
             # Make the API request
-            response = requests.post(self.base_url, json=request_data, headers=headers)
+            response = self._session.post(self.base_url, data=body, headers=headers, timeout=(10, 120))
             response.raise_for_status()
             
-            response_data = response.json()
+            response_data = orjson.loads(response.content)
+            
+            if response_data.get("usage"):
+                self._record_cache_usage(response_data["usage"])
             
             # Extract the AI response
             if "choices" in response_data and len(response_data["choices"]) > 0:
@@ -130,77 +374,11 @@ class OpenRouterClient:
                 
                 # Parse the JSON response
                 try:
-                    import re
-                    
-                    # Technique 1: Clean markdown code blocks
-                    clean_response = ai_response.strip()
-                    if "```json" in clean_response:
-                        # Extract content between ```json and ```
-                        match = re.search(r'```json\s*(.*?)\s*```', clean_response, re.DOTALL)
-                        if match:
-                            clean_response = match.group(1)
-                    elif "```" in clean_response:
-                        # Extract content between ``` and ```
-                        match = re.search(r'```\s*(.*?)\s*```', clean_response, re.DOTALL)
-                        if match:
-                            clean_response = match.group(1)
-                    
-                    # Technique 2: Find the first { and last }
-                    json_start = clean_response.find('{')
-                    json_end = clean_response.rfind('}')
-                    
-                    if json_start != -1:
-                        # If we found a start but the end is missing or before the start
-                        if json_end == -1 or json_end < json_start:
-                            self.logger.warning("JSON seems truncated, attempting smart repair...")
-                            clean_response = self._repair_json(clean_response[json_start:])
-                        else:
-                            clean_response = clean_response[json_start:json_end+1]
-                    
-                    # Try to parse
-                    try:
-                        analysis_result = json.loads(clean_response)
-                    except json.JSONDecodeError as e1:
-                        self.logger.warning(f"Standard JSON parse failed: {e1}")
-                        
-                        # Technique 3: Try to fix common JSON errors
-                        try:
-                            # Remove trailing commas
-                            clean_response_fixed = re.sub(r',\s*([}\]])', r'\1', clean_response)
-                            # Fix unescaped quotes
-                            clean_response_fixed = re.sub(r'(?<=\w)"(?=\w)', '\\"', clean_response_fixed)
-                            # Try smart repair again on the fixed version if it looks truncated
-                            if not clean_response_fixed.endswith(('}', ']')):
-                                clean_response_fixed = self._repair_json(clean_response_fixed)
-                                
-                            analysis_result = json.loads(clean_response_fixed)
-                        except json.JSONDecodeError as e2:
-                            self.logger.warning(f"Fix attempt failed: {e2}")
-                            
-                            # Technique 4: Try ast.literal_eval (handles Python dict syntax which is common from AI)
-                            import ast
-                            try:
-                                self.logger.warning("Trying ast.literal_eval...")
-                                # Replace JSON null/true/false with Python None/True/False
-                                python_syntax = clean_response.replace('null', 'None').replace('true', 'True').replace('false', 'False')
-                                analysis_result = ast.literal_eval(python_syntax)
-                            except Exception as e3:
-                                self.logger.error(f"All parsing attempts failed.")
-                                self.logger.error(f"Original JSON error: {e1}")
-                                self.logger.error(f"Fix attempt error: {e2}")
-                                self.logger.error(f"AST error: {e3}")
-                                
-                                # Raise the original error as it's usually the most descriptive
-                                raise ValueError(f"JSON Parse Error: {e1}")
+                    analysis_result = self._parse_analysis_result(ai_response)
                     
                     # Create PriorityReport object
-                    report = PriorityReport(
-                        urgent_conversations=analysis_result.get("urgent_conversations", []),
-                        important_conversations=analysis_result.get("important_conversations", []),
-                        normal_conversations=analysis_result.get("normal_conversations", []),
-                        summary=analysis_result.get("summary", ""),
-                        total_conversations=analysis_result.get("total_conversations", 0)
-                    )
+                    report = self._build_report(analysis_result)
+                    self._cache_analysis(cache_key, analysis_result)
                     
                     self.logger.info(f"Successfully analyzed conversations: {len(report.urgent_conversations)} urgent, {len(report.important_conversations)} important, {len(report.normal_conversations)} normal")
                     
@@ -226,102 +404,135 @@ class OpenRouterClient:
             self.logger.error(f"Failed to get analysis from OpenRouter: {e}")
             raise
     
-    def generate_summary_report(self, report: PriorityReport) -> str:
+    def _parse_analysis_result(self, ai_response: str) -> Dict[str, Any]:
         """
-        Generate a human-readable summary report from the AI analysis
+        Parse the AI's JSON reply, falling back to progressively more lenient repairs
         
         Args:
-            report: PriorityReport from AI analysis
+            ai_response: Raw message content returned by the model
         
         Returns:
-            Formatted summary string
+            Parsed analysis dictionary
+        
+        Raises:
+            ValueError: If no technique could parse the response
         """
-        def format_phone_link(chat_id: str, chat_name: str) -> str:
-            """Convert chat_id to WhatsApp link with phone number"""
-            # Extract phone number from chat_id (remove @c.us or @g.us)
-            phone = chat_id.replace('@c.us', '').replace('@g.us', '')
-            
-            # Check if it's a group chat
-            if '@g.us' in chat_id:
-                return f"• {chat_name} (קבוצה)"
+        # Fast path: the model returned a clean JSON object, no cleanup needed
+        stripped = ai_response.strip()
+        if stripped.startswith('{') and stripped.endswith('}'):
+            try:
+                return orjson.loads(stripped)
+            except json.JSONDecodeError:
+                pass
+        
+        # Technique 1: Strip a markdown code fence (``` or ```json line, closing ```).
+        # Text around a fence elsewhere is cut away by technique 2.
+        clean_response = stripped
+        if clean_response.startswith("```"):
+            clean_response = clean_response[clean_response.find("\n") + 1:]
+        if clean_response.endswith("```"):
+            clean_response = clean_response[:-3]
+        
+        # Technique 2: Find the first { and last }
+        json_start = clean_response.find('{')
+        json_end = clean_response.rfind('}')
+        
+        if json_start != -1:
+            # If we found a start but the end is missing or before the start
+            if json_end == -1 or json_end < json_start:
+                self.logger.warning("JSON seems truncated, attempting smart repair...")
+                clean_response = self._repair_json(clean_response[json_start:])
+            else:
+                clean_response = clean_response[json_start:json_end+1]
+        
+        # Try to parse
+        try:
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            analysis_result = orjson.loads(clean_response)
+        except json.JSONDecodeError as e1:
+            self.logger.warning(f"Standard JSON parse failed: {e1}")
             
-            # Create WhatsApp link for personal chats
-            wa_link = f"https://wa.me/{phone}"
-            return f"• {chat_name} ({phone})\n  💬 {wa_link}"
+            # Technique 3: Try to fix common JSON errors
+            try:
+                # Remove trailing commas
+                clean_response_fixed = _TRAILING_COMMA_RE.sub(r'\1', clean_response)
+                # Fix unescaped quotes
+                clean_response_fixed = _INNER_QUOTE_RE.sub('\\"', clean_response_fixed)
+                # Try smart repair again on the fixed version if it looks truncated
+                if not clean_response_fixed.endswith(('}', ']')):
+                    clean_response_fixed = self._repair_json(clean_response_fixed)
+                    
+                analysis_result = orjson.loads(clean_response_fixed)
+            except json.JSONDecodeError as e2:
+                self.logger.warning(f"Fix attempt failed: {e2}")
+                
+                # Technique 4: Try ast.literal_eval (handles Python dict syntax which is common from AI)
+                try:
+                    self.logger.warning("Trying ast.literal_eval...")
+                    # Replace JSON null/true/false with Python None/True/False in one pass,
+                    # leaving quoted strings untouched
+                    python_syntax = _JSON_LITERAL_RE.sub(_to_python_literal, clean_response)
+                    analysis_result = ast.literal_eval(python_syntax)
+                except Exception as e3:
+                    self.logger.error(f"All parsing attempts failed.")
+                    self.logger.error(f"Original JSON error: {e1}")
+                    self.logger.error(f"Fix attempt error: {e2}")
+                    self.logger.error(f"AST error: {e3}")
+                    
+                    # Raise the original error as it's usually the most descriptive
+                    raise ValueError(f"JSON Parse Error: {e1}")
         
-        summary_lines = []
-        summary_lines.append("📊 *דוח שיחות פתוחות*")
-        summary_lines.append(f"📅 נוצר בתאריך: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-        summary_lines.append(f"📈 סה\"כ שיחות פתוחות: {report.total_conversations}")
-        summary_lines.append("")
+        return analysis_result
+    
+    async def analyze_conversations_async(self, conversation_summaries: List[Dict]) -> PriorityReport:
+        """
+        Run analyze_conversations in a worker thread so the event loop stays free
         
-        if report.urgent_conversations:
-            summary_lines.append("🚨 *שיחות דחופות:*")
-            for conv in report.urgent_conversations:
-                summary_lines.append(format_phone_link(
-                    conv.get('chat_id', ''), 
-                    conv.get('chat_name', 'לא ידוע')
-                ))
-                summary_lines.append(f"  📌 סיבה: {conv.get('reason', '')}")
-            summary_lines.append("")
+        Several analyses can be awaited together with asyncio.gather; they share the
+        session's connection pool.
         
-        if report.important_conversations:
-            summary_lines.append("⭐ *שיחות חשובות:*")
-            for conv in report.important_conversations:
-                summary_lines.append(format_phone_link(
-                    conv.get('chat_id', ''), 
-                    conv.get('chat_name', 'לא ידוע')
-                ))
-                summary_lines.append(f"  📌 סיבה: {conv.get('reason', '')}")
-            summary_lines.append("")
+        Args:
+            conversation_summaries: List of conversation summaries to analyze
         
-        if report.normal_conversations:
-            summary_lines.append("📝 *שיחות רגילות:*")
-            for conv in report.normal_conversations[:3]:  # Show only first 3 normal conversations
-                phone = conv.get('chat_id', '').replace('@c.us', '').replace('@g.us', '')
-                summary_lines.append(f"• {conv.get('chat_name', 'לא ידוע')} ({phone})")
-            if len(report.normal_conversations) > 3:
-                summary_lines.append(f"• ועוד {len(report.normal_conversations) - 3} שיחות רגילות...")
-            summary_lines.append("")
+        Returns:
+            PriorityReport with categorized conversations
+        """
+        return await asyncio.to_thread(self.analyze_conversations, conversation_summaries)
+    
+    def generate_summary_report(self, report: PriorityReport) -> str:
+        """
+        Generate a human-readable summary report from the AI analysis
         
-        summary_lines.append("📋 *סיכום:*")
-        summary_lines.append(report.summary)
+        Args:
+            report: PriorityReport from AI analysis
         
-        return "\n".join(summary_lines)
+        Returns:
+            Formatted summary string
+        """
+        return "\n".join(_summary_lines(report))
 
     def _repair_json(self, json_str: str) -> str:
         """Attempt to repair truncated JSON by closing open brackets/braces"""
         stack = []
         in_string = False
-        escape = False
         
-        for char in json_str:
-            if escape:
-                escape = False
-                continue
-            if char == '\\':
-                escape = True
-                continue
-            if char == '"':
-                in_string = not in_string
-                continue
-            
-            if not in_string:
-                if char == '{':
-                    stack.append('}')
-                elif char == '[':
-                    stack.append(']')
-                elif char == '}' or char == ']':
-                    if stack and stack[-1] == char:
-                        stack.pop()
+        # Let the regex engine skip over string contents instead of visiting every character
+        for match in _JSON_STRUCTURE_RE.finditer(json_str):
+            token = match.group(0)
+            if token[0] == '"':
+                in_string = not match.group(1)
+            elif token in _JSON_CLOSERS:
+                stack.append(_JSON_CLOSERS[token])
+            elif stack and stack[-1] == token:
+                stack.pop()
         
         # Close string if open
         if in_string:
             json_str += '"'
-            
+        
         # Close all open structures
-        while stack:
-            closer = stack.pop()
-            json_str += closer
-            
-        return json_str
+        return json_str + ''.join(reversed(stack))
+
+
+# Global client instance, shared so every analysis reuses one pooled session
+openrouter_client = OpenRouterClient()
@@ -5,7 +5,7 @@ Test script to verify the send_report functionality
 import asyncio
 import logging
 from models import PriorityReport
-from openrouter_client import OpenRouterClient
+from openrouter_client import openrouter_client
 
 # Setup logging
 logging.basicConfig(
@@ -50,8 +50,8 @@ def test_generate_summary_report():
     )
     
     try:
-        # Create OpenRouter client
-        client = OpenRouterClient()
+        # Use the shared OpenRouter client
+        client = openrouter_client
         
         # Generate report
         print("\nGenerating summary report...")
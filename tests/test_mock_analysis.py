@@ -2,7 +2,7 @@ import asyncio
 import logging
 import sys
 import os
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from datetime import datetime
 
 # Add parent directory to path
@@ -10,25 +10,24 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import GreenAPIMessage, PriorityReport
 from whatsapp_bot import WhatsAppBot
+from green_api_client import GreenAPIClient
 from config import settings
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def run_test():
-    logger.info("Starting Mock Analysis Test")
-    
-    # Initialize bot
+def _make_bot():
+    """Bot with mocked Green API and OpenRouter clients over three chats; 456@c.us is answered"""
     bot = WhatsAppBot()
     
-    # Mock Green API Client
-    bot.green_client = MagicMock()
+    # Mock Green API Client (spec_set makes misspelled client methods fail fast)
+    bot.green_client = MagicMock(spec_set=GreenAPIClient)
     
-    # Mock incoming messages (3 chats)
     now = int(datetime.now().timestamp())
     
-    incoming_messages = [
+    # Incoming messages (3 chats)
+    bot.green_client.get_last_incoming_messages.return_value = [
         GreenAPIMessage(
             id_message="msg1", chat_id="123@c.us", type="incoming", 
             timestamp=now, type_message="textMessage", text_message="Hello",
@@ -46,86 +45,107 @@ async def run_test():
         )
     ]
     
-    bot.green_client.get_last_incoming_messages.return_value = incoming_messages
-    
-    # Mock Chat History
-    # Chat 1: Last message is incoming (Unanswered)
-    chat1_history = [
-        GreenAPIMessage(
-            id_message="msg1", chat_id="123@c.us", type="incoming", 
-            timestamp=now, type_message="textMessage", text_message="Hello",
-            sender_id="123@c.us", sender_name="User 1"
-        )
-    ]
-    
-    # Chat 2: Last message is outgoing (Answered)
-    chat2_history = [
+    # Outgoing messages: the last message in 456@c.us is our reply
+    bot.green_client.get_last_outgoing_messages.return_value = [
         GreenAPIMessage(
             id_message="reply1", chat_id="456@c.us", type="outgoing", 
             timestamp=now+10, type_message="textMessage", text_message="My reply",
             sender_id="me", sender_name="Me"
-        ),
-        GreenAPIMessage(
-            id_message="msg2", chat_id="456@c.us", type="incoming", 
-            timestamp=now, type_message="textMessage", text_message="Hi",
-            sender_id="456@c.us", sender_name="User 2"
         )
     ]
     
-    # Chat 3: Group chat (Unanswered)
-    chat3_history = [
-        GreenAPIMessage(
-            id_message="msg3", chat_id="789@g.us", type="incoming", 
-            timestamp=now, type_message="textMessage", text_message="Group msg",
-            sender_id="999@c.us", sender_name="User 3"
-        )
-    ]
-    
-    def get_history_side_effect(chat_id, count=10):
-        if chat_id == "123@c.us": return chat1_history
-        if chat_id == "456@c.us": return chat2_history
-        if chat_id == "789@g.us": return chat3_history
-        return []
-        
-    bot.green_client.get_chat_history.side_effect = get_history_side_effect
+    # Mock Send Message
+    bot.green_client.send_message.return_value = {"idMessage": "sent123"}
     
     # Mock OpenRouter Client
     bot.openrouter_client = MagicMock()
-    bot.openrouter_client.analyze_conversations.return_value = PriorityReport(
+    bot.openrouter_client.analyze_conversations_async = AsyncMock(return_value=PriorityReport(
         urgent_conversations=[], important_conversations=[], normal_conversations=[],
         summary="Test Summary", total_conversations=1
-    )
+    ))
     bot.openrouter_client.generate_summary_report.return_value = "Mock Report"
     
-    # Mock Send Message
-    bot.green_client.send_message.return_value = {"idMessage": "sent123"}
-    
-    # --- Test Case 1: Default Settings (No Groups, Only Open) ---
-    logger.info("\n=== Test Case 1: Default Settings (No Groups, Only Open) ===")
-    settings.analyze_group_chats = False
-    settings.analyze_all_conversations = False
-    
-    # We need to spy on message_analyzer.analyze_conversations to see what it received
-    # But it's easier to check the logs or the result if we mock the analyzer
-    # Let's just run it and check the logs (which will be printed)
-    
-    await bot.analyze_and_report_with_progress(minutes=60)
-    
-    # --- Test Case 2: Include Groups ---
-    logger.info("\n=== Test Case 2: Include Groups ===")
-    settings.analyze_group_chats = True
-    settings.analyze_all_conversations = False
-    
-    await bot.analyze_and_report_with_progress(minutes=60)
+    return bot
+
+
+def _analyze(bot, **overrides):
+    """Run one analysis with settings patched for its duration; returns the result dict"""
+    options = {"analyze_group_chats": False, "analyze_all_conversations": False, "llm_min_conversations": 0,
+               "user_phone_number": "972500000000"}
+    options.update(overrides)
+    with patch.multiple(settings, **options):
+        result = asyncio.run(bot.analyze_and_report_with_progress(minutes=60))
+    
+    bot.green_client.get_last_incoming_messages.assert_called_once_with(minutes=60)
+    bot.green_client.get_last_outgoing_messages.assert_called_once_with(minutes=60)
+    bot.green_client.send_message.assert_called_once()
+    assert bot.green_client.send_message.call_args[0][0] == f"{options['user_phone_number']}@c.us"
+    assert result["success"], result
+    return result
+
+
+def _ai_chat_ids(bot):
+    """Chat IDs of the summaries passed to the mocked AI call"""
+    bot.openrouter_client.analyze_conversations_async.assert_awaited_once()
+    return sorted(s["chat_id"] for s in bot.openrouter_client.analyze_conversations_async.await_args[0][0])
+
+
+def test_default_settings():
+    """No groups, only open conversations: the answered and group chats are skipped"""
+    bot = _make_bot()
+    result = _analyze(bot)
     
-    # --- Test Case 3: Analyze All ---
-    logger.info("\n=== Test Case 3: Analyze All ===")
-    settings.analyze_group_chats = True
-    settings.analyze_all_conversations = True
+    assert _ai_chat_ids(bot) == ["123@c.us"]
+    assert result["report"]["summary"] == "Test Summary", result
+
+
+def test_include_groups():
+    bot = _make_bot()
+    _analyze(bot, analyze_group_chats=True)
     
-    await bot.analyze_and_report_with_progress(minutes=60)
+    assert _ai_chat_ids(bot) == ["123@c.us", "789@g.us"]
+
+
+def test_analyze_all():
+    bot = _make_bot()
+    _analyze(bot, analyze_group_chats=True, analyze_all_conversations=True)
     
-    logger.info("\nTest Completed Successfully")
+    assert _ai_chat_ids(bot) == ["123@c.us", "456@c.us", "789@g.us"]
+
+
+def test_local_report_below_llm_min_conversations():
+    """Fewer open conversations than llm_min_conversations are reported without an AI call"""
+    bot = _make_bot()
+    result = _analyze(bot, analyze_group_chats=True, llm_min_conversations=5)
+    report = result["report"]
+    
+    bot.openrouter_client.analyze_conversations_async.assert_not_called()
+    assert report["total_conversations"] == 2, report
+    assert report["urgent_conversations"] == [] and report["normal_conversations"] == [], report
+    assert sorted(c["chat_id"] for c in report["important_conversations"]) == ["123@c.us", "789@g.us"], report
+    assert all(c["reason"] for c in report["important_conversations"]), report
+
+
+
+def test_no_report_recipient():
+    """Without a user phone or instance ID the report fails instead of going to '@c.us'"""
+    bot = _make_bot()
+    with patch.multiple(settings, user_phone_number="", green_api_id_instance=""):
+        try:
+            asyncio.run(bot.analyze_and_report_with_progress(minutes=60))
+        except ValueError as e:
+            assert "No report recipient" in str(e), e
+        else:
+            raise AssertionError("analysis without a report recipient did not fail")
+    
+    bot.green_client.send_message.assert_not_called()
+
 
 if __name__ == "__main__":
-    asyncio.run(run_test())
+    logger.info("Starting Mock Analysis Test")
+    for test in (test_default_settings, test_include_groups, test_analyze_all,
+                 test_local_report_below_llm_min_conversations, test_no_report_recipient):
+        logger.info(f"\n=== {test.__name__} ===")
+        test()
+    
+    logger.info("\nTest Completed Successfully")
@@ -1,15 +1,19 @@
 import logging
 import asyncio
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
 from green_api_client import GreenAPIClient
 from message_analyzer import MessageAnalyzer
-from openrouter_client import OpenRouterClient
+from openrouter_client import openrouter_client
 from models import GreenAPIMessage, PriorityReport, DashboardStats
 from config import settings
 from database import db
 
 
+def _no_progress(progress: int, message: str, details: str = ""):
+    """Progress callback for runs nobody is watching"""
+
+
 class WhatsAppBot:
     """Main WhatsApp bot service that coordinates all components"""
     
@@ -17,7 +21,7 @@ class WhatsAppBot:
         self.logger = logging.getLogger(__name__)
         self.green_client = GreenAPIClient()
         self.message_analyzer = MessageAnalyzer()
-        self.openrouter_client = OpenRouterClient()
+        self.openrouter_client = openrouter_client
         
         # Statistics tracking
         self.stats = DashboardStats(
@@ -27,6 +31,21 @@ class WhatsAppBot:
             last_analysis_time=datetime.now(),
             active_chats=0
         )
+        
+        # (phone, chat_id) of the default report recipient, rebuilt only when the
+        # configured phone changes (settings can be updated at runtime)
+        self._default_target = (None, None)
+    
+    @property
+    def _default_target_chat_id(self) -> str:
+        """Report recipient when none is given: the user's phone, else the instance's own number"""
+        phone = settings.user_phone_number or settings.green_api_id_instance
+        if not phone:
+            self.logger.error("No report recipient: set USER_PHONE_NUMBER or GREEN_API_ID_INSTANCE")
+            raise ValueError("No report recipient configured (USER_PHONE_NUMBER / GREEN_API_ID_INSTANCE)")
+        if phone != self._default_target[0]:
+            self._default_target = (phone, f"{phone}@c.us")
+        return self._default_target[1]
     
     async def analyze_and_report(self, target_chat_id: Optional[str] = None, minutes: int = None) -> Dict[str, Any]:
         """
@@ -39,105 +58,19 @@ class WhatsAppBot:
         Returns:
             Dictionary with analysis results
         """
+        if minutes is None:
+            minutes = settings.message_analysis_minutes
+        
         try:
-            if minutes is None:
-                minutes = settings.message_analysis_minutes
-            
-            self.logger.info(f"Starting message analysis for the last {minutes} minutes")
-            
-            # Step 1: Fetch messages from Green API
-            messages = self.green_client.get_last_incoming_messages(minutes=minutes)
-            
-            if not messages:
-                self.logger.info("No messages found for analysis")
-                return {
-                    "success": True,
-                    "message": "No messages found for analysis",
-                    "report": None
-                }
-            
-            # Store messages in database
-            new_messages_count = db.store_messages(messages)
-            self.logger.info(f"Stored {new_messages_count} new messages in database")
-            
-            # Update statistics
-            self.stats.total_messages = len(messages)
-            self.stats.last_analysis_time = datetime.now()
-            
-            # Step 2: Analyze messages and identify open conversations
-            all_conversations, conversation_summaries = self.message_analyzer.analyze_conversations(messages)
-            
-            # Update conversations in database
-            for conv in all_conversations:
-                db.update_conversation(
-                    conv.chat_id, conv.chat_name, conv.last_message_time,
-                    len(conv.messages), conv.is_unanswered
-                )
-            
-            # Update statistics
-            self.stats.active_chats = len(all_conversations)
-            self.stats.unanswered_conversations = len(conversation_summaries)
-            
-            if not conversation_summaries:
-                self.logger.info("No open conversations found")
-                empty_report = PriorityReport(
-                    urgent_conversations=[],
-                    important_conversations=[],
-                    normal_conversations=[],
-                    summary="לא נמצאו שיחות פתוחות. כל ההודעות נענו!",
-                    total_conversations=0
-                )
-                
-                # Send empty report
-                await self._send_report(empty_report, target_chat_id)
-                
-                return {
-                    "success": True,
-                    "message": "No open conversations found",
-                    "report": empty_report.dict(),
-                    "stats": self.stats.dict()
-                }
-            
-            # Step 3: Send to OpenRouter for prioritization
-            self.logger.info("Sending conversations to AI for prioritization")
-            priority_report = self.openrouter_client.analyze_conversations(conversation_summaries)
-            
-            # Update statistics
-            self.stats.urgent_conversations = len(priority_report.urgent_conversations)
-            
-            # Store analysis report in database
-            db.store_analysis_report(priority_report)
-            
-            # Update daily statistics
-            daily_stats = {
-                'date': datetime.now().date(),
-                'total_messages': self.stats.total_messages,
-                'unanswered_conversations': self.stats.unanswered_conversations,
-                'urgent_conversations': self.stats.urgent_conversations,
-                'active_chats': self.stats.active_chats,
-                'analyses_run': 1  # This will be incremented in DB
-            }
-            db.update_daily_stats(daily_stats)
-            
-            # Step 4: Generate and send report
-            await self._send_report(priority_report, target_chat_id)
-            
-            self.logger.info("Analysis and reporting completed successfully")
-            
-            return {
-                "success": True,
-                "message": f"Analysis completed. Found {priority_report.total_conversations} open conversations.",
-                "report": priority_report.dict(),
-                "stats": self.stats.dict()
-            }
+            # Scheduled runs also tell the user when everything has been answered
+            return await self._run_analysis(target_chat_id, minutes, send_empty_report=True)
         
         except Exception as e:
-            self.logger.error(f"Error during analysis and reporting: {e}")
             return {
                 "success": False,
                 "message": f"Error: {str(e)}",
                 "report": None,
-                "stats": self.stats.dict()
+                "stats": self.stats.model_dump()
             }
     
     async def analyze_and_report_with_progress(self, target_chat_id: Optional[str] = None, 
@@ -150,32 +83,50 @@ class WhatsAppBot:
             minutes: Time period in minutes to analyze
             progress_callback: Function to call with progress updates
         
+        Returns:
+            Analysis results
+        """
+        progress = progress_callback or _no_progress
+        return await self._run_analysis(target_chat_id, minutes, progress)
+    
+    async def _run_analysis(self, target_chat_id: Optional[str], minutes: int,
+                            progress: Callable = _no_progress, send_empty_report: bool = False) -> Dict[str, Any]:
+        """
+        Fetch, analyze, prioritize and report on recent messages (shared by both entry points)
+        
+        Args:
+            target_chat_id: Chat ID to send the report to (if None, sends to configured user)
+            minutes: Time period in minutes to analyze
+            progress: progress(progress, message, details) callback
+            send_empty_report: Also send a report when no open conversations are found
+        
         Returns:
             Analysis results
         """
         try:
+            self.logger.info(f"Starting message analysis for the last {minutes} minutes")
+            
             # Step 1: Fetch messages from Green API
-            if progress_callback:
-                progress_callback(10, "מושך הודעות מה-API...", "מתחבר ל-Green API")
+            progress(10, "מושך הודעות מה-API...", "מתחבר ל-Green API")
             
-            # Fetch incoming messages
-            incoming_messages = self.green_client.get_last_incoming_messages(minutes=minutes)
+            # Fetch incoming and outgoing messages concurrently (independent requests)
+            incoming_messages, outgoing_messages = await asyncio.gather(
+                asyncio.to_thread(self.green_client.get_last_incoming_messages, minutes=minutes),
+                asyncio.to_thread(self.green_client.get_last_outgoing_messages, minutes=minutes)
+            )
             
-            # Fetch outgoing messages
-            if progress_callback:
-                progress_callback(20, "מושך הודעות יוצאות...", "מתחבר ל-Green API")
-            outgoing_messages = self.green_client.get_last_outgoing_messages(minutes=minutes)
+            progress(20, "הודעות נכנסות ויוצאות התקבלו", "מתחבר ל-Green API")
             
-            # Combine all messages
-            all_messages = incoming_messages + outgoing_messages
+            # Combine all messages; no global timestamp sort is needed because the analyzer
+            # groups them with a single stable (chat_id, timestamp) sort
+            messages = incoming_messages + outgoing_messages
             
-            # Sort by timestamp (ascending)
-            all_messages.sort(key=lambda x: x.timestamp)
+            # Update statistics
+            self.stats.last_analysis_time = datetime.now()
             
-            if not all_messages:
-                self.stats.last_analysis_time = datetime.now()
-                if progress_callback:
-                    progress_callback(100, "✅ ניתוח הסתיים", "לא נמצאו הודעות לניתוח")
+            if not messages:
+                self.logger.info("No messages found for analysis")
+                progress(100, "✅ ניתוח הסתיים", "לא נמצאו הודעות לניתוח")
                 
                 return {
                     "success": True,
@@ -183,106 +134,128 @@ class WhatsAppBot:
                     "report": None
                 }
             
-            # Store messages in database
-            new_messages_count = db.store_messages(all_messages)
-            self.logger.info(f"Stored {new_messages_count} new messages in database")
+            progress(30, "מנתח שיחות...", f"נמצאו {len(messages)} הודעות סה\"כ")
             
-            if progress_callback:
-                progress_callback(30, "מנתח שיחות...", f"נמצאו {len(all_messages)} הודעות סה\"כ")
-            
-            # Update statistics
-            self.stats.total_messages = len(all_messages)
-            self.stats.last_analysis_time = datetime.now()
-            
-            # Use combined messages for analysis
-            messages = all_messages
+            self.stats.total_messages = len(messages)
             
             # Step 2: Analyze messages and identify open conversations
-            if progress_callback:
-                progress_callback(50, "מקבץ הודעות לפי צ'אטים...", "מזהה שיחות שלא נענו")
+            progress(50, "מקבץ הודעות לפי צ'אטים...", "מזהה שיחות שלא נענו")
             
-            all_conversations, conversation_summaries = self.message_analyzer.analyze_conversations(messages)
+            # Conversation rows for the database are built while grouping, not in a second pass
+            all_conversations, conversation_summaries, conversation_rows = (
+                self.message_analyzer.analyze_conversations(messages)
+            )
             
             self.logger.info(f"Analyzed {len(messages)} messages")
             self.logger.info(f"Found {len(all_conversations)} total conversations")
             self.logger.info(f"Found {len(conversation_summaries)} OPEN conversations (summaries)")
             
-            # Update conversations in database
-            for conv in all_conversations:
-                db.update_conversation(
-                    conv.chat_id, conv.chat_name, conv.last_message_time,
-                    len(conv.messages), conv.is_unanswered
-                )
+            # Store messages and update conversations in database with a single commit
+            with db.transaction():
+                new_messages_count = db.store_messages(messages)
+                db.bulk_update_conversations(conversation_rows)
+            self.logger.info(f"Stored {new_messages_count} new messages in database")
             
             # Update statistics
             self.stats.active_chats = len(all_conversations)
             self.stats.unanswered_conversations = len(conversation_summaries)
             
             if not conversation_summaries:
-                if progress_callback:
-                    progress_callback(100, "✅ ניתוח הסתיים", "לא נמצאו שיחות פתוחות")
-                
+                self.logger.info("No open conversations found")
                 empty_report = PriorityReport(
                     urgent_conversations=[],
                     important_conversations=[],
                     normal_conversations=[],
-                    summary="לא נמצאו שיחות פתוחות הדורשות תגובה."
+                    summary="לא נמצאו שיחות פתוחות. כל ההודעות נענו!",
+                    total_conversations=0
                 )
                 
+                if send_empty_report:
+                    await self._send_report(empty_report, target_chat_id)
+                
+                progress(100, "✅ ניתוח הסתיים", "לא נמצאו שיחות פתוחות")
+                
                 return {
                     "success": True,
                     "message": "No open conversations found",
-                    "report": empty_report.dict(),
-                    "stats": self.stats.dict()
+                    "report": empty_report.model_dump(),
+                    "stats": self.stats.model_dump()
                 }
             
-            # Step 3: Send to OpenRouter for prioritization
-            if progress_callback:
-                progress_callback(70, "שולח ל-AI לניתוח...", f"מנתח {len(conversation_summaries)} שיחות פתוחות")
-            
-            priority_report = self.openrouter_client.analyze_conversations(conversation_summaries)
+            # Step 3: Send to OpenRouter for prioritization (a few conversations don't need ranking)
+            if len(conversation_summaries) < settings.llm_min_conversations:
+                self.logger.info(f"Only {len(conversation_summaries)} open conversations, skipping AI prioritization")
+                priority_report = self._local_priority_report(conversation_summaries)
+            else:
+                self.logger.info("Sending conversations to AI for prioritization")
+                progress(70, "שולח ל-AI לניתוח...", f"מנתח {len(conversation_summaries)} שיחות פתוחות")
+                
+                priority_report = await self.openrouter_client.analyze_conversations_async(conversation_summaries)
             
             # Update statistics
             self.stats.urgent_conversations = len(priority_report.urgent_conversations)
             
-            # Store analysis report in database
-            db.store_analysis_report(priority_report)
-            
-            # Update daily statistics
+            # Store analysis report and update daily statistics with a single commit
             daily_stats = {
                 'date': datetime.now().date(),
                 'total_messages': self.stats.total_messages,
                 'unanswered_conversations': self.stats.unanswered_conversations,
                 'urgent_conversations': self.stats.urgent_conversations,
                 'active_chats': self.stats.active_chats,
-                'analyses_run': 1
+                'analyses_run': 1  # This will be incremented in DB
             }
-            db.update_daily_stats(daily_stats)
+            with db.transaction():
+                db.store_analysis_report(priority_report)
+                db.update_daily_stats(daily_stats)
             
             # Step 4: Generate and send report
-            if progress_callback:
-                progress_callback(90, "מכין דוח...", "מסדר תוצאות לפי דחיפות")
+            progress(90, "מכין דוח...", "מסדר תוצאות לפי דחיפות")
             
             await self._send_report(priority_report, target_chat_id)
             
-            if progress_callback:
-                progress_callback(100, "✅ ניתוח הסתיים בהצלחה!", f"נמצאו {priority_report.total_conversations} שיחות פתוחות")
+            progress(100, "✅ ניתוח הסתיים בהצלחה!", f"נמצאו {priority_report.total_conversations} שיחות פתוחות")
             
             self.logger.info("Analysis and reporting completed successfully")
             
             return {
                 "success": True,
                 "message": f"Analysis completed. Found {priority_report.total_conversations} open conversations. {priority_report.summary}",
-                "report": priority_report.dict(),
-                "stats": self.stats.dict()
+                "report": priority_report.model_dump(),
+                "stats": self.stats.model_dump()
             }
         
         except Exception as e:
             self.logger.error(f"Analysis failed: {e}")
-            if progress_callback:
-                progress_callback(100, "❌ שגיאה בניתוח", str(e))
+            progress(100, "❌ שגיאה בניתוח", str(e))
             raise
     
+    @staticmethod
+    def _local_priority_report(conversation_summaries: List[Dict]) -> PriorityReport:
+        """
+        Build a report without the LLM, listing every open conversation as important
+        
+        Args:
+            conversation_summaries: Open conversation summaries (longest waiting first)
+        
+        Returns:
+            PriorityReport for the given conversations
+        """
+        important = [
+            {
+                "chat_id": summary["chat_id"],
+                "chat_name": summary["chat_name"],
+                "reason": f"ממתין לתגובה מאז {summary['last_message_time']}"
+            }
+            for summary in conversation_summaries
+        ]
+        return PriorityReport(
+            urgent_conversations=[],
+            important_conversations=important,
+            normal_conversations=[],
+            summary=f"נמצאו {len(important)} שיחות פתוחות הממתינות לתגובה.",
+            total_conversations=len(important)
+        )
+    
     async def _send_report(self, report: PriorityReport, target_chat_id: Optional[str] = None):
         """
         Send the priority report via WhatsApp
@@ -302,21 +275,14 @@ class WhatsAppBot:
             self.logger.info(f"Formatted report length: {len(formatted_report)} characters")
             
             # If no target chat specified, send to user's configured phone number
+            # (falling back to the instance's own number)
             if target_chat_id is None:
-                self.logger.info("No target chat specified, determining recipient...")
-                self.logger.info(f"User phone number from settings: {settings.user_phone_number}")
-                
-                if settings.user_phone_number:
-                    target_chat_id = f"{settings.user_phone_number}@c.us"
-                    self.logger.info(f"Using user phone number: {target_chat_id}")
-                else:
-                    # Fallback to instance ID if no user phone configured
-                    target_chat_id = f"{settings.green_api_id_instance}@c.us"
-                    self.logger.info(f"Using instance ID as fallback: {target_chat_id}")
+                target_chat_id = self._default_target_chat_id
+                self.logger.info(f"No target chat specified, using default recipient: {target_chat_id}")
             
             # Send the report
             self.logger.info(f"Sending message to {target_chat_id}...")
-            result = self.green_client.send_message(target_chat_id, formatted_report)
+            result = await asyncio.to_thread(self.green_client.send_message, target_chat_id, formatted_report)
             
             self.logger.info(f"Report sent successfully to {target_chat_id}")
             self.logger.info(f"Send result: {result}")
@@ -324,10 +290,9 @@ class WhatsAppBot:
             return result
         
         except Exception as e:
-            self.logger.error(f"Failed to send report: {e}")
-            self.logger.error(f"Exception type: {type(e)}")
-            import traceback
-            self.logger.error(f"Traceback: {traceback.format_exc()}")
+            # logger.exception attaches the traceback to the record; it is only
+            # formatted if a handler actually emits it
+            self.logger.exception(f"Failed to send report ({type(e).__name__}): {e}")
             raise
     
     async def send_custom_message(self, chat_id: str, message: str) -> Dict[str, Any]:
@@ -342,7 +307,7 @@ class WhatsAppBot:
             Result from Green API
         """
         try:
-            result = self.green_client.send_message(chat_id, message)
+            result = await asyncio.to_thread(self.green_client.send_message, chat_id, message)
             self.logger.info(f"Custom message sent to {chat_id}")
             return result
         
@@ -362,7 +327,7 @@ class WhatsAppBot:
             return {
                 "success": True,
                 "account_info": account_info,
-                "bot_stats": self.stats.dict()
+                "bot_stats": self.stats.model_dump()
             }
         
         except Exception as e:
@@ -371,28 +336,32 @@ class WhatsAppBot:
                 "success": False,
                 "message": f"Error: {str(e)}",
                 "account_info": None,
-                "bot_stats": self.stats.dict()
+                "bot_stats": self.stats.model_dump()
             }
     
-    def get_recent_messages(self, minutes: int = 60, use_database: bool = True) -> List[Dict[str, Any]]:
+    def get_recent_messages(self, minutes: int = 60, use_database: bool = True,
+                            exclude_groups: bool = False, limit: int = 100) -> List[Dict[str, Any]]:
         """
         Get recent messages for debugging/monitoring
         
         Args:
             minutes: Time period in minutes
             use_database: Whether to fetch from database (default) or API
+            exclude_groups: Skip group chat messages
+            limit: Maximum number of messages to return from the database
         
         Returns:
             List of recent messages
         """
         try:
             if use_database:
-                # Get from database for better performance
-                return db.get_recent_messages(limit=100)
+                # Get from database for better performance (group filter runs in SQL)
+                return db.get_recent_messages(limit=limit, exclude_groups=exclude_groups)
             else:
                 # Get from API
                 messages = self.green_client.get_last_incoming_messages(minutes=minutes)
-                return [msg.dict() for msg in messages]
+                return [msg.model_dump() for msg in messages
+                        if not (exclude_groups and msg.chat_id.endswith('@g.us'))]
         
         except Exception as e:
             self.logger.error(f"Failed to get recent messages: {e}")
@@ -427,7 +396,7 @@ class WhatsAppBot:
         Args:
             interval_minutes: Interval between analyses in minutes
         """
-        self.logger.info(f"Starting scheduled analysis every {interval_minutes} minutes")
+        self.logger.info("Starting scheduled analysis every %s minutes", interval_minutes)
         
         while True:
             try:
@@ -435,7 +404,7 @@ class WhatsAppBot:
                 await asyncio.sleep(interval_minutes * 60)
             
             except Exception as e:
-                self.logger.error(f"Error in scheduled analysis: {e}")
+                self.logger.error("Error in scheduled analysis: %s", e)
                 await asyncio.sleep(60)  # Wait 1 minute before retrying
 
 